@@ -0,0 +1,268 @@
+import contextlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from api_common import (COMPRESS_MIN_BYTES, MAX_PAGE_SIZE, PRODUCT_QUERY_PARAMS, avg_price_by_category,
+                        encode_cursor, initial_data, parse_histogram_bins, parse_product_query,
+                        quantity_by_category, stats_etag, typed_arg)
+from backends import JsonStore, open_store
+from export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, export_chunks, parse_fields, project
+from schema import validate_category, validate_product
+from storage import BackgroundPersistence
+
+# Versão assíncrona (ASGI) da API, com as mesmas rotas principais do api_server.py:
+#   uvicorn api_asgi:app --port 3000
+# No backend json a gravação em disco fica numa thread de fundo
+# (STORAGE_WRITER=background por padrão), então nenhuma requisição espera E/S.
+store = open_store(initial_data, writer=os.environ.get('STORAGE_WRITER', 'background'))
+
+# Só o JsonStore com a gravação em segundo plano mexe apenas em memória e roda
+# direto no loop. O SQLite e o STORAGE_WRITER=inline (reescrita do db.json,
+# fsync do journal) fazem E/S e vão para o pool de threads; as leituras também,
+# porque esperariam o lock de uma escrita em andamento no pool
+IN_MEMORY_STORE = isinstance(store, JsonStore) and isinstance(store.persistence, BackgroundPersistence)
+
+async def call(func, *args, **kwargs):
+    if IN_MEMORY_STORE:
+        return func(*args, **kwargs)
+    return await run_in_threadpool(func, *args, **kwargs)
+
+def error(message, status):
+    return JSONResponse({"error": message}, status_code=status)
+
+def invalid(errors):
+    return JSONResponse({"error": "Dados inválidos", "errors": errors}, status_code=400)
+
+def not_modified(request, etag, last_modified):
+    # Mesmas regras do api_server.not_modified (ETag fraco, depois a data)
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or f'"{etag}"' in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def conditional(request, etag, changed_at, build):
+    """Resposta com ETag/Last-Modified; `build` só é chamado se o cliente não tiver a versão atual."""
+    last_modified = None
+    if changed_at is not None:
+        last_modified = datetime.fromtimestamp(changed_at, timezone.utc)
+    if not_modified(request, etag, last_modified):
+        response = Response(status_code=304)
+    else:
+        response = await build()
+        if response.status_code != 200:
+            return response
+    response.headers['ETag'] = f'W/"{etag}"'
+    if last_modified is not None:
+        response.headers['Last-Modified'] = format_datetime(last_modified, usegmt=True)
+    return response
+
+def with_change_seq(response, epoch, seq):
+    response.headers['X-Store-Epoch'] = epoch
+    response.headers['X-Change-Seq'] = str(seq)
+    return response
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+# Rotas da API
+async def get_products(request):
+    args = request.query_params
+    try:
+        fields = parse_fields(args.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+    epoch, seq = await call(store.current_seq)
+    etag, changed_at = await call(store.collection_state, 'products')
+    if not any(param in args for param in PRODUCT_QUERY_PARAMS):
+        async def build_all():
+            products = await call(store.list_products)
+            return JSONResponse([project(product, fields) for product in products])
+        response = await conditional(request, etag, changed_at, build_all)
+        return with_change_seq(response, epoch, seq)
+
+    try:
+        query = parse_product_query(args)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async def build():
+        items, after = await call(store.query, **query)
+        response = JSONResponse([project(item, fields) for item in items])
+        if after is not None:
+            response.headers['X-Next-Cursor'] = encode_cursor(query['sort'], after)
+        return response
+    return await conditional(request, etag, changed_at, build)
+
+async def search_products(request):
+    text = request.query_params.get('q', '')
+    limit = typed_arg(request.query_params, 'limit', int, 20)
+    if limit is None or not 1 <= limit <= MAX_PAGE_SIZE:
+        return error(f"limit deve estar entre 1 e {MAX_PAGE_SIZE}", 400)
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+    etag, changed_at = await call(store.collection_state, 'products')
+
+    async def build():
+        products = await call(store.search, text, limit)
+        return JSONResponse([project(product, fields) for product in products])
+    return await conditional(request, etag, changed_at, build)
+
+async def export_products(request):
+    export_format = request.query_params.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return error(f"format deve ser um de {', '.join(EXPORT_FORMATS)}", 400)
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    epoch, seq = await call(store.current_seq)
+    # Iterador síncrono: o Starlette consome cada bloco no pool de threads
+    chunks = export_chunks(export_format, store.iter_products(EXPORT_BATCH_SIZE), fields)
+    response = StreamingResponse(chunks, media_type=EXPORT_FORMATS[export_format], headers={
+        'Content-Disposition': f'attachment; filename=products.{export_format}',
+    })
+    return with_change_seq(response, epoch, seq)
+
+async def get_product(request):
+    product_id = request.path_params['product_id']
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+    etag = await call(store.product_etag, product_id)
+    if etag is None:
+        return error("Product not found", 404)
+    _, changed_at = await call(store.collection_state, 'products')
+
+    async def build():
+        return JSONResponse(project(await call(store.get_product, product_id), fields))
+    return await conditional(request, etag, changed_at, build)
+
+async def create_product(request):
+    new_product = await read_json(request)
+    errors = validate_product(new_product)
+    if errors:
+        return invalid(errors)
+    new_product['createdAt'] = datetime.now().isoformat()
+    new_product = await call(store.create_product, new_product)
+
+    return JSONResponse(new_product, status_code=201)
+
+async def update_product(request):
+    updated_data = await read_json(request)
+    errors = validate_product(updated_data, partial=True)
+    if errors:
+        return invalid(errors)
+    product = await call(store.update_product, request.path_params['product_id'], updated_data)
+    if not product:
+        return error("Product not found", 404)
+
+    return JSONResponse(product)
+
+async def delete_product(request):
+    await call(store.delete_product, request.path_params['product_id'])
+
+    return JSONResponse({"message": "Product deleted"})
+
+async def get_categories(request):
+    epoch, seq = await call(store.current_seq)
+    etag, changed_at = await call(store.collection_state, 'categories')
+
+    async def build():
+        return JSONResponse(await call(store.list_categories))
+    response = await conditional(request, etag, changed_at, build)
+    return with_change_seq(response, epoch, seq)
+
+async def create_category(request):
+    new_category = await read_json(request)
+    errors = validate_category(new_category)
+    if errors:
+        return invalid(errors)
+    new_category = await call(store.create_category, new_category)
+
+    return JSONResponse(new_category, status_code=201)
+
+async def get_changes(request):
+    since = typed_arg(request.query_params, 'since', int)
+    if since is None:
+        return error("since é obrigatório", 400)
+    limit = typed_arg(request.query_params, 'limit', int, 1000)
+    if limit is None or not 1 <= limit <= MAX_PAGE_SIZE:
+        return error(f"limit deve estar entre 1 e {MAX_PAGE_SIZE}", 400)
+    return JSONResponse(await call(store.changes_since, request.query_params.get('epoch'), since, limit))
+
+async def category_stats(request, build_rows):
+    products_etag, products_changed = await call(store.collection_state, 'products')
+    categories_etag, categories_changed = await call(store.collection_state, 'categories')
+
+    async def build():
+        totals = await call(store.category_totals)
+        return JSONResponse(build_rows(totals, await call(store.list_categories)))
+    return await conditional(request, stats_etag(products_etag, categories_etag),
+                             max(products_changed, categories_changed), build)
+
+async def stats_quantity_by_category(request):
+    return await category_stats(request, quantity_by_category)
+
+async def stats_avg_price_by_category(request):
+    return await category_stats(request, avg_price_by_category)
+
+async def stats_price_histogram(request):
+    try:
+        bins = parse_histogram_bins(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+    etag, changed_at = await call(store.collection_state, 'products')
+
+    async def build():
+        edges, counts = await call(store.price_histogram, bins)
+        return JSONResponse({"edges": edges, "counts": counts})
+    return await conditional(request, etag, changed_at, build)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    # Esvazia a fila da thread de gravação antes de sair
+    await run_in_threadpool(store.close)
+
+app = Starlette(routes=[
+    Route('/products', get_products, methods=['GET']),
+    Route('/products', create_product, methods=['POST']),
+    Route('/products/search', search_products, methods=['GET']),
+    Route('/products/export', export_products, methods=['GET']),
+    Route('/products/{product_id:int}', get_product, methods=['GET']),
+    Route('/products/{product_id:int}', update_product, methods=['PUT']),
+    Route('/products/{product_id:int}', delete_product, methods=['DELETE']),
+    Route('/categories', get_categories, methods=['GET']),
+    Route('/categories', create_category, methods=['POST']),
+    Route('/changes', get_changes, methods=['GET']),
+    Route('/stats/quantity-by-category', stats_quantity_by_category, methods=['GET']),
+    Route('/stats/avg-price-by-category', stats_avg_price_by_category, methods=['GET']),
+    Route('/stats/price-histogram', stats_price_histogram, methods=['GET']),
+], middleware=[
+    # Só gzip aqui; o brotli fica na versão Flask
+    Middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES),
+], lifespan=lifespan)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=int(os.environ.get('API_PORT', '3000')), log_level='warning')
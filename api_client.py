@@ -0,0 +1,183 @@
+import asyncio
+import collections
+import re
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Cliente HTTP usado pelo main.py. Uma só Session para o app inteiro: as
+# conexões ficam abertas (keep-alive) e são reaproveitadas entre os cliques, em
+# vez de abrir um TCP novo a cada requests.get/post.
+
+DEFAULT_TIMEOUT = (3.05, 10)  # (conexão, leitura) em segundos
+RETRIES = 3
+RETRY_BACKOFF = 0.2  # espera 0.2s, 0.4s, 0.8s entre as tentativas
+# Só métodos idempotentes são repetidos depois que o servidor recebeu o pedido;
+# falhas de conexão (nada foi enviado) são repetidas para qualquer método
+RETRY_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE"})
+RETRY_STATUSES = (502, 503, 504)
+POOL_SIZE = 10
+LATENCY_LOG_SIZE = 1000
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def route_of(url):
+    # /products/42 e /products/7 entram no mesmo grupo do relatório
+    return _ID_SEGMENT.sub("/<id>", urlsplit(url).path) or "/"
+
+
+def can_resend(method, error):
+    """Se a requisição que falhou com `error` (httpx) pode ser enviada de novo sem duplicar nada."""
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+        # Nada chegou ao servidor
+        return True
+    return method in RETRY_METHODS and isinstance(error, httpx.TransportError)
+
+
+class LatencyLog:
+    """Registro das últimas requisições: (método, rota, status, segundos).
+
+    O status fica None quando a requisição falhou sem resposta.
+    """
+
+    def __init__(self, log_latency=False):
+        self.log_latency = log_latency
+        self.latencies = collections.deque(maxlen=LATENCY_LOG_SIZE)
+        self.latencies_lock = threading.Lock()
+
+    def record(self, method, url, status, seconds):
+        route = route_of(url)
+        with self.latencies_lock:
+            self.latencies.append((method, route, status, seconds))
+        if self.log_latency:
+            print(f"{method} {route} {status or 'erro'} {seconds * 1000:.1f} ms")
+
+    def latency_report(self):
+        """Linhas "MÉTODO rota  n  p50  p95  máx" das últimas LATENCY_LOG_SIZE requisições."""
+        groups = {}
+        with self.latencies_lock:
+            for method, route, _, seconds in self.latencies:
+                groups.setdefault((method, route), []).append(seconds * 1000)
+        lines = []
+        for (method, route), samples in sorted(groups.items()):
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            lines.append(f"{method:<6} {route:<32} n={len(samples):<5} p50={statistics.median(samples):8.1f} ms  "
+                         f"p95={p95:8.1f} ms  máx={samples[-1]:8.1f} ms")
+        return lines
+
+
+class ApiClient(LatencyLog):
+    """Session com pool de conexões, timeout padrão, retentativas e registro de latência.
+
+    Os métodos get/post/put/delete aceitam os mesmos argumentos do `requests`.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=RETRIES, backoff=RETRY_BACKOFF,
+                 pool_size=POOL_SIZE, log_latency=False):
+        super().__init__(log_latency)
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        status = None
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            self.record(method, url, status, time.perf_counter() - start)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncApiClient(LatencyLog):
+    """Versão asyncio do ApiClient, sobre httpx.AsyncClient.
+
+    Mesmo timeout, pool e política de retentativas. As respostas têm a
+    interface usada pelo app (status_code, json(), text, headers); as falhas
+    sem resposta levantam httpx.HTTPError.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=RETRIES, backoff=RETRY_BACKOFF,
+                 pool_size=POOL_SIZE, log_latency=False):
+        super().__init__(log_latency)
+        self.retries = retries
+        self.backoff = backoff
+        connect, read = timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def request(self, method, url, **kwargs):
+        status = None
+        start = time.perf_counter()
+        try:
+            response = await self.send(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            self.record(method, url, status, time.perf_counter() - start)
+
+    async def send(self, method, url, **kwargs):
+        # Mesma regra do Retry do ApiClient (ver can_resend)
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if last or not can_resend(method, e):
+                    raise
+            else:
+                if last or method not in RETRY_METHODS or response.status_code not in RETRY_STATUSES:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
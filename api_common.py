@@ -0,0 +1,160 @@
+import base64
+import gzip
+import json
+import os
+from datetime import datetime
+from backends import SORT_FIELDS
+
+try:
+    import brotli
+except ImportError:
+    # Opcional: sem ele as respostas saem só em gzip
+    brotli = None
+
+# Partes da API que não dependem do framework: usadas pelo api_server.py (Flask)
+# e pelo api_asgi.py (Starlette)
+
+# Dados iniciais (usados apenas quando ainda não existe nada gravado)
+initial_data = {
+    "products": [
+        {
+            "id": 1,
+            "name": "Notebook Dell",
+            "price": 4500.00,
+            "quantity": 10,
+            "categoryId": 1,
+            "createdAt": datetime.now().isoformat()
+        },
+        {
+            "id": 2,
+            "name": "iPhone 13",
+            "price": 6000.00,
+            "quantity": 15,
+            "categoryId": 2,
+            "createdAt": datetime.now().isoformat()
+        },
+        {
+            "id": 3,
+            "name": "Monitor LG",
+            "price": 1200.00,
+            "quantity": 8,
+            "categoryId": 3,
+            "createdAt": datetime.now().isoformat()
+        }
+    ],
+    "categories": [
+        {"id": 1, "name": "Notebooks"},
+        {"id": 2, "name": "Celulares"},
+        {"id": 3, "name": "Monitores"}
+    ]
+}
+
+# Parâmetros aceitos em GET /products; sem nenhum deles a lista completa é devolvida
+PRODUCT_QUERY_PARAMS = ('name', 'categoryId', 'minPrice', 'maxPrice', 'sort', 'limit', 'cursor')
+MAX_PAGE_SIZE = 1000
+
+# Tipo da chave de cada ordenação no cursor (ver indexes.SORT_KEYS)
+CURSOR_KEY_TYPES = {'id': int, 'name': str, 'price': (int, float)}
+
+def encode_cursor(sort, after):
+    raw = json.dumps([sort, after[0], after[1]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(sort, cursor):
+    try:
+        cursor_sort, key, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("cursor inválido")
+    if cursor_sort != sort:
+        raise ValueError("cursor pertence a outra ordenação")
+    # A chave é comparada com as do índice: um tipo diferente levantaria TypeError lá
+    if not _is_cursor_value(key, CURSOR_KEY_TYPES[sort]) or not _is_cursor_value(last_id, int):
+        raise ValueError("cursor inválido")
+    return key, last_id
+
+def _is_cursor_value(value, types):
+    return isinstance(value, types) and not isinstance(value, bool)
+
+def typed_arg(args, name, type, default=None):
+    # Como o args.get(name, type=...) do Flask, mas para qualquer mapeamento
+    # (request.args do Flask ou query_params do Starlette)
+    try:
+        return type(args[name]) if name in args else default
+    except (TypeError, ValueError):
+        return default
+
+def parse_product_query(args):
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort deve ser um de {', '.join(SORT_FIELDS)} (prefixo - para decrescente)")
+    query = {
+        'name': args.get('name') or None,
+        'category_id': typed_arg(args, 'categoryId', int),
+        'min_price': typed_arg(args, 'minPrice', float),
+        'max_price': typed_arg(args, 'maxPrice', float),
+        'sort': sort,
+        'descending': descending,
+        'limit': typed_arg(args, 'limit', int),
+        'after': None,
+    }
+    for param, key in (('categoryId', 'category_id'), ('minPrice', 'min_price'),
+                       ('maxPrice', 'max_price'), ('limit', 'limit')):
+        if param in args and query[key] is None:
+            raise ValueError(f"{param} inválido")
+    if query['limit'] is not None and not 1 <= query['limit'] <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit deve estar entre 1 e {MAX_PAGE_SIZE}")
+    if args.get('cursor'):
+        query['after'] = decode_cursor(sort, args['cursor'])
+    return query
+
+# Estatísticas para os gráficos (/stats/...): os stores mantêm os totais por
+# categoria e o índice de preços, então a resposta custa O(categorias) ou
+# O(faixas), qualquer que seja o tamanho do catálogo
+DEFAULT_HISTOGRAM_BINS = 10
+MAX_HISTOGRAM_BINS = 100
+
+def stats_etag(products_etag, categories_etag):
+    # Os gráficos por categoria dependem dos produtos (totais) e das categorias (nomes)
+    return f"{products_etag}.{categories_etag}"
+
+def _with_names(totals, categories):
+    # name fica None para categoryId sem categoria cadastrada
+    names = {category['id']: category.get('name') for category in categories}
+    return [dict(row, name=names.get(row['categoryId'])) for row in totals]
+
+def quantity_by_category(totals, categories):
+    rows = [{'categoryId': row['categoryId'], 'name': row['name'], 'quantity': row['quantity']}
+            for row in _with_names(totals, categories)]
+    return sorted(rows, key=lambda row: row['quantity'], reverse=True)
+
+def avg_price_by_category(totals, categories):
+    rows = [{'categoryId': row['categoryId'], 'name': row['name'], 'count': row['count'],
+             'avgPrice': row['priceSum'] / row['count']}
+            for row in _with_names(totals, categories) if row['count']]
+    return sorted(rows, key=lambda row: row['avgPrice'], reverse=True)
+
+def parse_histogram_bins(args):
+    bins = typed_arg(args, 'bins', int, DEFAULT_HISTOGRAM_BINS)
+    if bins is None or not 1 <= bins <= MAX_HISTOGRAM_BINS:
+        raise ValueError(f"bins deve estar entre 1 e {MAX_HISTOGRAM_BINS}")
+    return bins
+
+# Compressão das respostas: só vale a pena acima de alguns KB
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def choose_encoding(quality):
+    # quality(nome) -> peso da codificação no Accept-Encoding (0 quando não aceita)
+    if brotli is not None and quality('br'):
+        return 'br'
+    if quality('gzip'):
+        return 'gzip'
+    return None
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
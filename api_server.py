@@ -1,117 +1,436 @@
+import atexit
 import json
-from datetime import datetime
-from flask import Flask, jsonify, request
+import os
+import signal
+import sys
+from datetime import datetime, timezone
+from flask import Flask, Response, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from api_common import (COMPRESS_MIN_BYTES, MAX_PAGE_SIZE, PRODUCT_QUERY_PARAMS, avg_price_by_category,
+                        choose_encoding, compress, encode_cursor, initial_data, parse_histogram_bins,
+                        parse_product_query, quantity_by_category, stats_etag)
+from backends import MissingRecordsError, open_store
+from export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, export_chunks, parse_fields, project
+from schema import validate_category, validate_product
+
+try:
+    import orjson
+except ImportError:
+    # Opcional: sem ele o jsonify usa o json da biblioteca padrão
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify com orjson; formatação com indent (modo debug) e tipos que ele
+    não conhece seguem pelo provider padrão do Flask."""
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs.get('indent'):
+            try:
+                return orjson.dumps(obj, default=self.default).decode()
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
+# Backend configurável por DB_BACKEND (json ou sqlite); carrega os dados
+# existentes e só grava os dados iniciais na primeira execução
+store = open_store(initial_data)
+# Ao sair, grava o que ainda estiver na fila (STORAGE_WRITER=background) e fecha os arquivos
+atexit.register(store.close)
+
+def not_modified(etag, last_modified=None):
+    # Responde 304 antes de buscar/serializar qualquer registro
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def conditional(etag, changed_at, build):
+    """Resposta com ETag/Last-Modified; `build` só é chamado se o cliente não tiver a versão atual."""
+    last_modified = None
+    if changed_at is not None:
+        last_modified = datetime.fromtimestamp(changed_at, timezone.utc)
+    if not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        response = build()
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+def negotiated_encoding():
+    return choose_encoding(lambda name: request.accept_encodings[name])
+
+@app.after_request
+def compress_response(response):
+    # gzip/brotli conforme o Accept-Encoding, só para corpos acima de COMPRESS_MIN_BYTES
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiated_encoding()
+    if encoding is None or response.content_length is None or response.content_length < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# Corpo já serializado (e comprimido) das listas completas, por coleção, campos
+# e codificação. Vale enquanto o ETag (a versão da coleção) não mudar, então um
+# GET repetido sem escritas no meio só copia bytes.
+body_cache = {}
+BODY_CACHE_MAX_ENTRIES = 32
+
+def cached_list(collection, etag, load, fields=None):
+    encoding = negotiated_encoding()
+    key = (collection, fields, encoding)
+    cached = body_cache.get(key)
+    if cached is None or cached[0] != etag:
+        records = load()
+        if fields is not None:
+            records = [project(record, fields) for record in records]
+        body = app.json.response(records).get_data()
+        applied = encoding if encoding is not None and len(body) >= COMPRESS_MIN_BYTES else None
+        if applied is not None:
+            body = compress(body, applied)
+        if key not in body_cache and len(body_cache) >= BODY_CACHE_MAX_ENTRIES:
+            # Combinações de `fields` são livres: descarta a entrada mais antiga
+            body_cache.pop(next(iter(body_cache)), None)
+        cached = body_cache[key] = (etag, body, applied)
+    _, body, applied = cached
+    response = app.response_class(body, mimetype=app.json.mimetype)
+    response.vary.add('Accept-Encoding')
+    if applied is not None:
+        response.headers['Content-Encoding'] = applied
+    return response
+
+def invalid(errors):
+    return jsonify({"error": "Dados inválidos", "errors": errors}), 400
 
-# Dados iniciais
-data = {
-    "products": [
-        {
-            "id": 1,
-            "name": "Notebook Dell",
-            "price": 4500.00,
-            "quantity": 10,
-            "categoryId": 1,
-            "createdAt": datetime.now().isoformat()
-        },
-        {
-            "id": 2,
-            "name": "iPhone 13",
-            "price": 6000.00,
-            "quantity": 15,
-            "categoryId": 2,
-            "createdAt": datetime.now().isoformat()
-        },
-        {
-            "id": 3,
-            "name": "Monitor LG",
-            "price": 1200.00,
-            "quantity": 8,
-            "categoryId": 3,
-            "createdAt": datetime.now().isoformat()
-        }
-    ],
-    "categories": [
-        {"id": 1, "name": "Notebooks"},
-        {"id": 2, "name": "Celulares"},
-        {"id": 3, "name": "Monitores"}
-    ]
-}
-
-# Salva os dados iniciais em um arquivo JSON
-with open('db.json', 'w') as f:
-    json.dump(data, f, indent=2)
+def with_change_seq(response, epoch, seq):
+    # Posição no feed de /changes a partir da qual o cliente deve sincronizar
+    response.headers['X-Store-Epoch'] = epoch
+    response.headers['X-Change-Seq'] = str(seq)
+    return response
+
+# Operações em lote: até MAX_BULK_ITEMS itens por requisição, aplicados de uma
+# vez (ou nenhum, se algum item for inválido) com uma única gravação em disco
+MAX_BULK_ITEMS = 100_000
+
+def read_bulk_items():
+    # Aceita um array JSON ou NDJSON (um objeto por linha)
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        items = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    raise ValueError(f"linha {number} não é JSON válido")
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValueError("o corpo deve ser um array JSON ou NDJSON")
+    if len(items) > MAX_BULK_ITEMS:
+        raise ValueError(f"no máximo {MAX_BULK_ITEMS} itens por lote")
+    return items
+
+def bulk_failure(total, failures, status):
+    # Itens com erro recebem seu próprio status; os demais, 424 (não aplicados)
+    items = [failures.get(i, {"index": i, "status": 424}) for i in range(total)]
+    return jsonify({"error": "Nenhum item foi aplicado", "items": items}), status
+
+def bulk_id(item):
+    value = item.get('id') if isinstance(item, dict) else item
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return None
 
 # Rotas da API
 @app.route('/products', methods=['GET'])
 def get_products():
-    return jsonify(data['products'])
+    # ?fields=id,name,price devolve só esses campos de cada produto
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    epoch, seq = store.current_seq()
+    etag, changed_at = store.collection_state('products')
+    if not any(param in request.args for param in PRODUCT_QUERY_PARAMS):
+        response = conditional(etag, changed_at,
+                               lambda: cached_list('products', etag, store.list_products, fields))
+        return with_change_seq(response, epoch, seq)
+    
+    try:
+        query = parse_product_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def build():
+        items, after = store.query(**query)
+        response = jsonify([project(item, fields) for item in items])
+        # Próxima página: repetir a requisição com ?cursor=<X-Next-Cursor>
+        if after is not None:
+            response.headers['X-Next-Cursor'] = encode_cursor(query['sort'], after)
+        return response
+    return conditional(etag, changed_at, build)
+
+@app.route('/products/search', methods=['GET'])
+def search_products():
+    # Busca por nome sem acentos/maiúsculas, ordenada por relevância
+    text = request.args.get('q', '')
+    limit = request.args.get('limit', 20, type=int)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit deve estar entre 1 e {MAX_PAGE_SIZE}"}), 400
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    etag, changed_at = store.collection_state('products')
+    return conditional(etag, changed_at, lambda: jsonify(
+        [project(product, fields) for product in store.search(text, limit)]))
+
+@app.route('/products/export', methods=['GET'])
+def export_products():
+    # Catálogo completo em NDJSON ou CSV, gerado em blocos; ?fields=id,name,price projeta os campos
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"format deve ser um de {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    epoch, seq = store.current_seq()
+    chunks = export_chunks(export_format, store.iter_products(EXPORT_BATCH_SIZE), fields)
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format], headers={
+        'Content-Disposition': f'attachment; filename=products.{export_format}',
+    })
+    return with_change_seq(response, epoch, seq)
+
+@app.route('/products/bulk', methods=['POST'])
+def bulk_create_products():
+    try:
+        items = read_bulk_items()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    failures = {}
+    for index, item in enumerate(items):
+        errors = validate_product(item)
+        if errors:
+            failures[index] = {"index": index, "status": 400, "errors": errors}
+    if failures:
+        return bulk_failure(len(items), failures, 400)
+    
+    created_at = datetime.now().isoformat()
+    for item in items:
+        item['createdAt'] = created_at
+    created = store.bulk_create_products(items)
+    return jsonify({"items": [
+        {"index": index, "status": 201, "id": product['id']} for index, product in enumerate(created)
+    ]}), 201
+
+@app.route('/products/bulk', methods=['PATCH'])
+def bulk_update_products():
+    try:
+        items = read_bulk_items()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    failures = {}
+    updates = []
+    for index, item in enumerate(items):
+        product_id = bulk_id(item)
+        errors = [] if product_id is not None else ["id inteiro é obrigatório"]
+        errors += validate_product(item, partial=True)
+        if errors:
+            failures[index] = {"index": index, "status": 400, "errors": errors}
+        else:
+            updates.append((product_id, {k: v for k, v in item.items() if k != 'id'}))
+    if failures:
+        return bulk_failure(len(items), failures, 400)
+    
+    try:
+        store.bulk_update_products(updates)
+    except MissingRecordsError as e:
+        missing = set(e.ids)
+        failures = {index: {"index": index, "status": 404, "error": "Product not found"}
+                    for index, (product_id, _) in enumerate(updates) if product_id in missing}
+        return bulk_failure(len(items), failures, 404)
+    return jsonify({"items": [
+        {"index": index, "status": 200, "id": product_id} for index, (product_id, _) in enumerate(updates)
+    ]})
+
+@app.route('/products/bulk', methods=['DELETE'])
+def bulk_delete_products():
+    try:
+        items = read_bulk_items()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    product_ids = [bulk_id(item) for item in items]
+    failures = {index: {"index": index, "status": 400, "errors": ["id inteiro é obrigatório"]}
+                for index, product_id in enumerate(product_ids) if product_id is None}
+    if failures:
+        return bulk_failure(len(items), failures, 400)
+    
+    try:
+        store.bulk_delete_products(product_ids)
+    except MissingRecordsError as e:
+        missing = set(e.ids)
+        failures = {index: {"index": index, "status": 404, "error": "Product not found"}
+                    for index, product_id in enumerate(product_ids) if product_id in missing}
+        return bulk_failure(len(items), failures, 404)
+    return jsonify({"items": [
+        {"index": index, "status": 200, "id": product_id} for index, product_id in enumerate(product_ids)
+    ]})
 
 @app.route('/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
-    product = next((p for p in data['products'] if p['id'] == product_id), None)
-    if product:
-        return jsonify(product)
-    return jsonify({"error": "Product not found"}), 404
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    etag = store.product_etag(product_id)
+    if etag is None:
+        return jsonify({"error": "Product not found"}), 404
+    _, changed_at = store.collection_state('products')
+    return conditional(etag, changed_at,
+                       lambda: jsonify(project(store.get_product(product_id), fields)))
 
 @app.route('/products', methods=['POST'])
 def create_product():
-    new_product = request.get_json()
-    new_product['id'] = max(p['id'] for p in data['products']) + 1
+    new_product = request.get_json(silent=True)
+    errors = validate_product(new_product)
+    if errors:
+        return invalid(errors)
     new_product['createdAt'] = datetime.now().isoformat()
-    data['products'].append(new_product)
-    
-    # Atualiza o arquivo db.json
-    with open('db.json', 'w') as f:
-        json.dump(data, f, indent=2)
+    new_product = store.create_product(new_product)
     
     return jsonify(new_product), 201
 
 @app.route('/products/<int:product_id>', methods=['PUT'])
 def update_product(product_id):
-    product = next((p for p in data['products'] if p['id'] == product_id), None)
+    updated_data = request.get_json(silent=True)
+    errors = validate_product(updated_data, partial=True)
+    if errors:
+        return invalid(errors)
+    product = store.update_product(product_id, updated_data)
     if not product:
         return jsonify({"error": "Product not found"}), 404
     
-    updated_data = request.get_json()
-    product.update(updated_data)
-    
-    # Atualiza o arquivo db.json
-    with open('db.json', 'w') as f:
-        json.dump(data, f, indent=2)
-    
     return jsonify(product)
 
 @app.route('/products/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
-    global data
-    data['products'] = [p for p in data['products'] if p['id'] != product_id]
-    
-    # Atualiza o arquivo db.json
-    with open('db.json', 'w') as f:
-        json.dump(data, f, indent=2)
+    store.delete_product(product_id)
     
     return jsonify({"message": "Product deleted"}), 200
 
 @app.route('/categories', methods=['GET'])
 def get_categories():
-    return jsonify(data['categories'])
+    epoch, seq = store.current_seq()
+    etag, changed_at = store.collection_state('categories')
+    response = conditional(etag, changed_at,
+                           lambda: cached_list('categories', etag, store.list_categories))
+    return with_change_seq(response, epoch, seq)
+
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    # Alterações desde a posição `since`; com "reset": true o cliente recarrega tudo
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({"error": "since é obrigatório"}), 400
+    limit = request.args.get('limit', 1000, type=int)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit deve estar entre 1 e {MAX_PAGE_SIZE}"}), 400
+    return jsonify(store.changes_since(request.args.get('epoch'), since, limit))
+
+@app.route('/changes/stream', methods=['GET'])
+def stream_changes():
+    # Server-Sent Events: uma mensagem por alteração; Last-Event-ID retoma a conexão
+    epoch = request.args.get('epoch')
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    if since is None:
+        epoch, since = store.current_seq()
+    
+    def events():
+        position = since
+        while True:
+            feed = store.changes_since(epoch, position)
+            if feed['reset']:
+                yield f"event: reset\ndata: {json.dumps(feed)}\n\n"
+                return
+            for change in feed['changes']:
+                yield f"id: {change['seq']}\ndata: {json.dumps(change)}\n\n"
+            position = feed['version']
+            if not feed['changes'] and not store.wait_for_changes(position, timeout=15):
+                yield ": keep-alive\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
 
 @app.route('/categories', methods=['POST'])
 def create_category():
-    new_category = request.get_json()
-    if not data['categories']:
-        new_category['id'] = 1
-    else:
-        new_category['id'] = max(c['id'] for c in data['categories']) + 1
-    data['categories'].append(new_category)
-    
-    # Atualiza o arquivo db.json
-    with open('db.json', 'w') as f:
-        json.dump(data, f, indent=2)
+    new_category = request.get_json(silent=True)
+    errors = validate_category(new_category)
+    if errors:
+        return invalid(errors)
+    new_category = store.create_category(new_category)
     
     return jsonify(new_category), 201
 
+# Estatísticas para os gráficos: resposta pequena, calculada com os totais
+# que o store mantém a cada escrita
+def category_stats(build_rows):
+    products_etag, products_changed = store.collection_state('products')
+    categories_etag, categories_changed = store.collection_state('categories')
+    return conditional(stats_etag(products_etag, categories_etag), max(products_changed, categories_changed),
+                       lambda: jsonify(build_rows(store.category_totals(), store.list_categories())))
+
+@app.route('/stats/quantity-by-category', methods=['GET'])
+def stats_quantity_by_category():
+    return category_stats(quantity_by_category)
+
+@app.route('/stats/avg-price-by-category', methods=['GET'])
+def stats_avg_price_by_category():
+    return category_stats(avg_price_by_category)
+
+@app.route('/stats/price-histogram', methods=['GET'])
+def stats_price_histogram():
+    # ?bins=N faixas de mesma largura entre o menor e o maior preço
+    try:
+        bins = parse_histogram_bins(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    etag, changed_at = store.collection_state('products')
+
+    def build():
+        edges, counts = store.price_histogram(bins)
+        return jsonify({"edges": edges, "counts": counts})
+    return conditional(etag, changed_at, build)
+
 if __name__ == '__main__':
-    app.run(port=3000, debug=True)
\ No newline at end of file
+    port = int(os.environ.get('API_PORT', '3000'))
+    # SIGTERM também encerra pelo caminho normal, passando pelo atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # API_SERVER=waitress: servidor WSGI de produção, com API_THREADS threads
+    if os.environ.get('API_SERVER', 'flask') == 'waitress':
+        from waitress import serve
+        serve(app, port=port, threads=int(os.environ.get('API_THREADS', '8')))
+    else:
+        app.run(
+            port=port,
+            debug=os.environ.get('API_DEBUG', '1') == '1',
+            threaded=True
+        )
\ No newline at end of file
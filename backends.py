@@ -0,0 +1,866 @@
+import collections
+import contextlib
+import copy
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from indexes import SORT_KEYS, CategoryIndex, CategoryStats, NameIndex, SortedIndex, fold
+from product_filters import product_matcher
+from storage import next_ids_of, open_persistence
+
+# Backends de armazenamento da API (variável DB_BACKEND):
+#   json   -> dados em memória, persistidos pelo storage.py (padrão)
+#   sqlite -> banco SQLite em modo WAL, com índices
+BACKENDS = ("json", "sqlite")
+
+# Quantas alterações o feed de /changes guarda; clientes mais atrasados recarregam tudo
+CHANGELOG_SIZE = int(os.environ.get("CHANGELOG_SIZE", "10000"))
+BULK_REINDEX_MIN = 1000
+
+PRODUCT_COLUMNS = ("id", "name", "price", "quantity", "categoryId", "createdAt")
+CATEGORY_COLUMNS = ("id", "name")
+SORT_FIELDS = tuple(SORT_KEYS)
+
+
+class MissingRecordsError(LookupError):
+    """Operação em lote que cita ids inexistentes; nada foi alterado."""
+
+    def __init__(self, ids):
+        super().__init__(f"ids inexistentes: {ids}")
+        self.ids = ids
+
+
+class ReadWriteLock:
+    """Vários leitores ao mesmo tempo ou um único escritor.
+
+    Escritores esperando têm prioridade sobre novos leitores, para que um fluxo
+    contínuo de leituras não impeça as escritas.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            self._cond.wait_for(lambda: not self._writer and not self._readers)
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class JsonStore:
+    """Catálogo em memória; cada alteração é repassada para a persistência.
+
+    Os registros ficam em dicionários id -> registro (na ordem de inserção), então
+    buscas, alterações e exclusões são O(1). Os ids vêm de contadores monotônicos
+    gravados junto com os dados, para não serem reaproveitados após um restart.
+
+    Cada alteração incrementa `version` e entra no feed de alterações (as últimas
+    CHANGELOG_SIZE). As versões valem só durante a execução do processo, por isso
+    ETags e feed levam também o `epoch` gerado na inicialização.
+
+    Seguro para servidores multi-thread: alterações (incluindo a alocação de ids
+    e a gravação no journal, na mesma ordem) acontecem sob o lock de escrita, e
+    leituras que percorrem os índices sob o lock de leitura. A E/S de disco (fsync
+    do journal, reescrita do db.json) fica fora do lock. Registros nunca são alterados no lugar (uma alteração cria um novo
+    dicionário), então quem já leu um registro pode serializá-lo sem lock.
+    """
+
+    def __init__(self, persistence, initial_data):
+        self.persistence = persistence
+        data = persistence.load()
+        if data is None:
+            data = copy.deepcopy(initial_data)
+        self.products = {p["id"]: p for p in data.get("products", [])}
+        self.categories = {c["id"]: c for c in data.get("categories", [])}
+        self.next_ids = next_ids_of(data)
+        if "meta" not in data:
+            persistence.seed(self.snapshot())
+
+        self._build_indexes()
+
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        started_at = time.time()
+        self.changed = {"products": (0, started_at), "categories": (0, started_at)}
+        self.product_versions = {}
+        self.changes = collections.deque(maxlen=CHANGELOG_SIZE)
+        self.changes_cond = threading.Condition()
+        self.lock = ReadWriteLock()
+
+    def _commit(self, mutations):
+        # Numera as mutações, registra no feed de alterações e grava no journal.
+        # Chamado sob o lock de escrita; devolve o que deve ser passado para
+        # persistence.sync depois de liberar o lock.
+        now = time.time()
+        with self.changes_cond:
+            for op, collection, payload in mutations:
+                self.version += 1
+                self.changed[collection] = (self.version, now)
+                change = {"seq": self.version, "op": op, "collection": collection}
+                if op == "put":
+                    change["id"] = payload["id"]
+                    change["record"] = dict(payload)
+                    if collection == "products":
+                        self.product_versions[payload["id"]] = self.version
+                else:
+                    change["id"] = payload
+                    self.product_versions.pop(payload, None)
+                self.changes.append(change)
+            self.changes_cond.notify_all()
+        return self.persistence.append(mutations, self.snapshot)
+
+    def current_seq(self):
+        return self.epoch, self.version
+
+    def changes_since(self, epoch, since, limit=1000):
+        """Alterações com seq > since. `reset` indica que o cliente deve recarregar tudo."""
+        with self.changes_cond:
+            oldest = self.changes[0]["seq"] if self.changes else self.version + 1
+            if epoch != self.epoch or since > self.version or since < oldest - 1:
+                return {"epoch": self.epoch, "version": self.version, "reset": True, "changes": []}
+            start = since - oldest + 1
+            changes = list(itertools.islice(self.changes, start, start + limit))
+        version = changes[-1]["seq"] if changes else since
+        return {"epoch": self.epoch, "version": version, "reset": False, "changes": changes}
+
+    def wait_for_changes(self, since, timeout):
+        with self.changes_cond:
+            return self.changes_cond.wait_for(lambda: self.version > since, timeout)
+
+    def collection_state(self, collection):
+        """(etag, timestamp da última alteração) de uma coleção, sem ler os registros."""
+        version, changed_at = self.changed[collection]
+        return f"{self.epoch}-{version}", changed_at
+
+    def product_etag(self, product_id):
+        if product_id not in self.products:
+            return None
+        return f"{self.epoch}-{self.product_versions.get(product_id, 0)}"
+
+    def _build_indexes(self):
+        products = self.products.values()
+        self.sort_indexes = {field: SortedIndex(key, products) for field, key in SORT_KEYS.items()}
+        self.category_index = CategoryIndex(products)
+        self.category_stats = CategoryStats(products)
+        self.name_index = NameIndex(products)
+
+    def _bulk_reindex(self, count):
+        # Inserir um a um nas listas ordenadas é O(n) por item: para lotes
+        # grandes em relação ao catálogo sai mais barato reconstruir tudo
+        return count > BULK_REINDEX_MIN and count * 4 > len(self.products)
+
+    def _index(self, product):
+        for index in self.sort_indexes.values():
+            index.add(product)
+        self.category_index.add(product)
+        self.category_stats.add(product)
+        self.name_index.add(product)
+
+    def _unindex(self, product):
+        for index in self.sort_indexes.values():
+            index.remove(product)
+        self.category_index.remove(product)
+        self.category_stats.remove(product)
+        self.name_index.remove(product)
+
+    def snapshot(self):
+        return {
+            "products": list(self.products.values()),
+            "categories": list(self.categories.values()),
+            "meta": {"nextIds": dict(self.next_ids)},
+        }
+
+    def _allocate_id(self, collection):
+        new_id = self.next_ids[collection]
+        self.next_ids[collection] = new_id + 1
+        return new_id
+
+    def list_products(self):
+        with self.lock.read():
+            return list(self.products.values())
+
+    def get_product(self, product_id):
+        return self.products.get(product_id)
+
+    def iter_products(self, batch_size=1000):
+        """Produtos em ordem de id, em lotes, sem copiar o catálogo.
+
+        Cada lote retoma do último id pelo índice, então alterações feitas
+        durante a exportação não interrompem a iteração.
+        """
+        id_index = self.sort_indexes["id"]
+        after = None
+        while True:
+            with self.lock.read():
+                batch = [self.products[product_id] for _, product_id
+                         in itertools.islice(id_index.iter_range(after=after), batch_size)]
+            if not batch:
+                return
+            yield batch
+            after = (batch[-1]["id"], batch[-1]["id"])
+
+    def _candidates(self, category_id, min_price, max_price, sort, descending, after):
+        # Escolhe a menor fonte de candidatos: a categoria, a faixa de preço ou o
+        # índice da ordenação. Fontes fora da ordem pedida são reordenadas.
+        sort_index = self.sort_indexes[sort]
+        price_index = self.sort_indexes["price"]
+        has_price_range = min_price is not None or max_price is not None
+        sources = [(len(sort_index), "sort")]
+        if category_id is not None:
+            sources.append((len(self.category_index.ids(category_id)), "category"))
+        if has_price_range:
+            start, end = price_index.bounds(min_price, max_price)
+            sources.append((end - start, "price"))
+        _, source = min(sources)
+
+        if source == "category" and sort == "id":
+            after_id = after[1] if after is not None else None
+            return self.category_index.iter_ids(category_id, after_id, descending)
+        if (source == "price" and sort == "price") or source == "sort":
+            low, high = (min_price, max_price) if sort == "price" else (None, None)
+            return sort_index.iter_range(low, high, after, descending)
+
+        if source == "category":
+            ids = self.category_index.ids(category_id)
+        else:
+            ids = [pid for _, pid in price_index.entries[start:end]]
+        subset = SortedIndex(SORT_KEYS[sort], (self.products[pid] for pid in ids))
+        return subset.iter_range(after=after, descending=descending)
+
+    def query(self, name=None, category_id=None, min_price=None, max_price=None,
+              sort="id", descending=False, limit=None, after=None):
+        """Filtra e ordena os produtos usando os índices secundários.
+
+        Retorna (itens, próximo cursor); o cursor é a tupla (chave, id) do último
+        item e vale None quando não há mais páginas.
+        """
+        matches = product_matcher(name, category_id, min_price, max_price)
+        items = []
+        with self.lock.read():
+            candidates = self._candidates(category_id, min_price, max_price, sort, descending, after)
+            for _, product_id in candidates:
+                product = self.products[product_id]
+                if matches(product):
+                    items.append(product)
+                    if limit is not None and len(items) > limit:
+                        break
+
+        if limit is None or len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        last = items[-1]
+        return items, (SORT_KEYS[sort](last), last["id"])
+
+    def search(self, text, limit=20):
+        with self.lock.read():
+            return [self.products[product_id] for product_id in self.name_index.search(text, limit)]
+
+    def category_totals(self):
+        """Totais por categoria: [{categoryId, count, quantity, priceSum}], sem percorrer os produtos."""
+        with self.lock.read():
+            return self.category_stats.rows()
+
+    def price_histogram(self, bins):
+        with self.lock.read():
+            return self.sort_indexes["price"].histogram(bins)
+
+    def create_product(self, product):
+        with self.lock.write():
+            product["id"] = self._allocate_id("products")
+            self.products[product["id"]] = product
+            self._index(product)
+            token = self._commit([("put", "products", product)])
+        self.persistence.sync(token)
+        return product
+
+    def update_product(self, product_id, changes):
+        changes.pop("id", None)
+        with self.lock.write():
+            product = self.products.get(product_id)
+            if product is None:
+                return None
+            updated = self.products[product_id] = {**product, **changes}
+            self._unindex(product)
+            self._index(updated)
+            token = self._commit([("put", "products", updated)])
+        self.persistence.sync(token)
+        return updated
+
+    def delete_product(self, product_id):
+        with self.lock.write():
+            product = self.products.pop(product_id, None)
+            if product is None:
+                return False
+            self._unindex(product)
+            token = self._commit([("delete", "products", product_id)])
+        self.persistence.sync(token)
+        return True
+
+    def bulk_create_products(self, products):
+        with self.lock.write():
+            reindex = self._bulk_reindex(len(products))
+            for product in products:
+                product["id"] = self._allocate_id("products")
+                self.products[product["id"]] = product
+                if not reindex:
+                    self._index(product)
+            if reindex:
+                self._build_indexes()
+            token = self._commit([("put", "products", product) for product in products])
+        self.persistence.sync(token)
+        return products
+
+    def bulk_update_products(self, updates):
+        """Aplica [(id, alterações)] de uma vez; se algum id não existir, nada muda."""
+        with self.lock.write():
+            missing = [product_id for product_id, _ in updates if product_id not in self.products]
+            if missing:
+                raise MissingRecordsError(missing)
+            reindex = self._bulk_reindex(len(updates))
+            updated = []
+            for product_id, changes in updates:
+                changes.pop("id", None)
+                product = self.products[product_id]
+                new = self.products[product_id] = {**product, **changes}
+                if not reindex:
+                    self._unindex(product)
+                    self._index(new)
+                updated.append(new)
+            if reindex:
+                self._build_indexes()
+            token = self._commit([("put", "products", product) for product in updated])
+        self.persistence.sync(token)
+        return updated
+
+    def bulk_delete_products(self, product_ids):
+        product_ids = list(dict.fromkeys(product_ids))
+        with self.lock.write():
+            missing = [product_id for product_id in product_ids if product_id not in self.products]
+            if missing:
+                raise MissingRecordsError(missing)
+            reindex = self._bulk_reindex(len(product_ids))
+            for product_id in product_ids:
+                product = self.products.pop(product_id)
+                if not reindex:
+                    self._unindex(product)
+            if reindex:
+                self._build_indexes()
+            token = self._commit([("delete", "products", product_id) for product_id in product_ids])
+        self.persistence.sync(token)
+        return product_ids
+
+    def list_categories(self):
+        return list(self.categories.values())
+
+    def create_category(self, category):
+        with self.lock.write():
+            category["id"] = self._allocate_id("categories")
+            self.categories[category["id"]] = category
+            token = self._commit([("put", "categories", category)])
+        self.persistence.sync(token)
+        return category
+
+    def close(self):
+        self.persistence.close()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    price REAL,
+    quantity INTEGER,
+    categoryId INTEGER,
+    createdAt TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_products_category ON products(categoryId);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products(price);
+CREATE INDEX IF NOT EXISTS idx_products_price_key ON products(IFNULL(price, 0));
+CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_name_fts USING fts5(name_folded, tokenize='trigram');
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS collection_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updatedAt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY,
+    op TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    recordId INTEGER NOT NULL,
+    record TEXT
+);
+CREATE TABLE IF NOT EXISTS category_stats (
+    key TEXT PRIMARY KEY,
+    categoryId INTEGER,
+    count INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    priceSum REAL NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS products_stats_insert AFTER INSERT ON products BEGIN
+    INSERT INTO category_stats (key, categoryId, count, quantity, priceSum)
+    VALUES (quote(NEW.categoryId), NEW.categoryId, 1, IFNULL(NEW.quantity, 0), IFNULL(NEW.price, 0))
+    ON CONFLICT (key) DO UPDATE SET count = count + 1, quantity = quantity + excluded.quantity,
+                                    priceSum = priceSum + excluded.priceSum;
+END;
+CREATE TRIGGER IF NOT EXISTS products_stats_delete AFTER DELETE ON products BEGIN
+    UPDATE category_stats SET count = count - 1, quantity = quantity - IFNULL(OLD.quantity, 0),
+                              priceSum = priceSum - IFNULL(OLD.price, 0)
+    WHERE key = quote(OLD.categoryId);
+    DELETE FROM category_stats WHERE key = quote(OLD.categoryId) AND count <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS products_stats_update AFTER UPDATE OF price, quantity, categoryId ON products BEGIN
+    UPDATE category_stats SET count = count - 1, quantity = quantity - IFNULL(OLD.quantity, 0),
+                              priceSum = priceSum - IFNULL(OLD.price, 0)
+    WHERE key = quote(OLD.categoryId);
+    DELETE FROM category_stats WHERE key = quote(OLD.categoryId) AND count <= 0;
+    INSERT INTO category_stats (key, categoryId, count, quantity, priceSum)
+    VALUES (quote(NEW.categoryId), NEW.categoryId, 1, IFNULL(NEW.quantity, 0), IFNULL(NEW.price, 0))
+    ON CONFLICT (key) DO UPDATE SET count = count + 1, quantity = quantity + excluded.quantity,
+                                    priceSum = priceSum + excluded.priceSum;
+END;
+"""
+
+# Colunas adicionadas depois da criação do esquema original
+SQLITE_MIGRATIONS = (
+    ("products", "rev", "ALTER TABLE products ADD COLUMN rev INTEGER NOT NULL DEFAULT 0"),
+)
+
+# As consultas são sempre as mesmas strings parametrizadas, então o sqlite3
+# reaproveita os statements já preparados (cache por conexão).
+SQL_SELECT_PRODUCTS = "SELECT id, name, price, quantity, categoryId, createdAt, extra FROM products"
+# Chaves de ordenação e dos filtros de preço, iguais às do JsonStore (indexes.SORT_KEYS):
+# produto sem preço vale 0, não NULL, e a paginação por keyset não para nele
+SQL_SORT_KEYS = {"id": "id", "name": "name", "price": "IFNULL(price, 0)"}
+SQL_LIST_PRODUCTS = SQL_SELECT_PRODUCTS + " ORDER BY id"
+SQL_GET_PRODUCT = SQL_SELECT_PRODUCTS + " WHERE id = ?"
+SQL_PRODUCTS_AFTER = SQL_SELECT_PRODUCTS + " WHERE id > ? ORDER BY id LIMIT ?"
+SQL_INSERT_PRODUCT = ("INSERT INTO products (name, price, quantity, categoryId, createdAt, extra) "
+                      "VALUES (?, ?, ?, ?, ?, ?)")
+SQL_UPDATE_PRODUCT = ("UPDATE products SET name = ?, price = ?, quantity = ?, categoryId = ?, "
+                      "createdAt = ?, extra = ? WHERE id = ?")
+SQL_DELETE_PRODUCT = "DELETE FROM products WHERE id = ?"
+SQL_INDEX_NAME = "INSERT OR REPLACE INTO products_name_fts (rowid, name_folded) VALUES (?, ?)"
+SQL_UNINDEX_NAME = "DELETE FROM products_name_fts WHERE rowid = ?"
+# Mesma relevância do NameIndex: nome igual, começa com, palavra começa com, no meio
+SQL_SEARCH_RANK = ("CASE WHEN f.name_folded = :q THEN 0 "
+                   "WHEN substr(f.name_folded, 1, length(:q)) = :q THEN 1 "
+                   "WHEN instr(' ' || f.name_folded, ' ' || :q) > 0 THEN 2 ELSE 3 END, "
+                   "length(f.name_folded), f.name_folded, p.id")
+SQL_SEARCH_TRIGRAM = ("SELECT p.id, p.name, p.price, p.quantity, p.categoryId, p.createdAt, p.extra "
+                      "FROM products_name_fts f JOIN products p ON p.id = f.rowid "
+                      "WHERE f.name_folded MATCH :phrase ORDER BY " + SQL_SEARCH_RANK + " LIMIT :limit")
+SQL_SEARCH_PREFIX = ("SELECT p.id, p.name, p.price, p.quantity, p.categoryId, p.createdAt, p.extra "
+                     "FROM products_name_fts f JOIN products p ON p.id = f.rowid "
+                     "WHERE f.name_folded LIKE :q || '%' OR f.name_folded LIKE '% ' || :q || '%' "
+                     "ORDER BY " + SQL_SEARCH_RANK + " LIMIT :limit")
+SQL_BUMP_VERSION = "UPDATE meta SET value = value + 1 WHERE key = 'version'"
+SQL_GET_VERSION = "SELECT value FROM meta WHERE key = 'version'"
+SQL_SET_COLLECTION_VERSION = ("INSERT OR REPLACE INTO collection_versions (name, version, updatedAt) "
+                              "VALUES (?, ?, ?)")
+SQL_GET_COLLECTION_VERSION = "SELECT version, updatedAt FROM collection_versions WHERE name = ?"
+SQL_SET_PRODUCT_REV = "UPDATE products SET rev = ? WHERE id = ?"
+SQL_GET_PRODUCT_REV = "SELECT rev FROM products WHERE id = ?"
+SQL_INSERT_CHANGE = "INSERT INTO changes (seq, op, collection, recordId, record) VALUES (?, ?, ?, ?, ?)"
+SQL_PRUNE_CHANGES = "DELETE FROM changes WHERE seq <= ?"
+SQL_OLDEST_CHANGE = "SELECT MIN(seq) FROM changes"
+SQL_CHANGES_SINCE = "SELECT seq, op, collection, recordId, record FROM changes WHERE seq > ? ORDER BY seq LIMIT ?"
+# Totais por categoria mantidos pelos triggers products_stats_* (chave: quote(categoryId),
+# para o produto sem categoria também ter sua linha)
+SQL_CATEGORY_TOTALS = "SELECT categoryId, count, quantity, priceSum FROM category_stats"
+SQL_BUILD_CATEGORY_STATS = ("INSERT INTO category_stats (key, categoryId, count, quantity, priceSum) "
+                            "SELECT quote(categoryId), categoryId, COUNT(*), IFNULL(SUM(quantity), 0), "
+                            "IFNULL(SUM(price), 0) FROM products GROUP BY categoryId")
+SQL_PRICE_RANGE = "SELECT MIN(IFNULL(price, 0)), MAX(IFNULL(price, 0)) FROM products"
+SQL_PRICE_BUCKETS = ("SELECT MIN(CAST((IFNULL(price, 0) - :low) / :width AS INTEGER), :last), COUNT(*) "
+                     "FROM products GROUP BY 1")
+SQL_LIST_CATEGORIES = "SELECT id, name, extra FROM categories ORDER BY id"
+SQL_INSERT_CATEGORY = "INSERT INTO categories (name, extra) VALUES (?, ?)"
+
+
+def _split_record(record, columns):
+    # Separa as colunas conhecidas dos campos extras (guardados como JSON)
+    values = [record.get(col) for col in columns if col != "id"]
+    extra = {k: v for k, v in record.items() if k not in columns}
+    values.append(json.dumps(extra) if extra else None)
+    return values
+
+
+def _casefold(text):
+    return str(text).casefold() if text is not None else ""
+
+
+def _row_to_record(row, columns):
+    record = {col: value for col, value in zip(columns, row) if value is not None}
+    extra = row[len(columns)]
+    if extra:
+        record.update(json.loads(extra))
+    return record
+
+
+class SQLiteStore:
+    """Catálogo em SQLite (WAL), com uma conexão por thread."""
+
+    def __init__(self, path, initial_data):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            has_name_index = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'products_name_fts'").fetchone()
+            has_category_stats = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'category_stats'").fetchone()
+            conn.executescript(SQLITE_SCHEMA)
+            if not has_category_stats:
+                # Banco criado antes dos totais por categoria
+                conn.execute(SQL_BUILD_CATEGORY_STATS)
+            for table, column, ddl in SQLITE_MIGRATIONS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(ddl)
+            # A versão fica no banco, então vale entre processos e restarts
+            now = time.time()
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)",
+                         (uuid.uuid4().hex[:8],))
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+            for collection in ("products", "categories"):
+                conn.execute("INSERT OR IGNORE INTO collection_versions (name, version, updatedAt) "
+                             "VALUES (?, 0, ?)", (collection, now))
+            self.epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+            empty = not conn.execute("SELECT 1 FROM sqlite_sequence LIMIT 1").fetchone()
+        if empty:
+            self._seed(initial_data)
+        elif not has_name_index:
+            # Banco criado antes do índice de busca por nome
+            with conn:
+                conn.executemany(SQL_INDEX_NAME, (
+                    (product_id, fold(name or ""))
+                    for product_id, name in conn.execute("SELECT id, name FROM products")
+                ))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            # O LIKE do SQLite só ignora maiúsculas em ASCII; o filtro ?name= usa o
+            # mesmo casefold do product_matcher
+            conn.create_function("casefold", 1, _casefold, deterministic=True)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _seed(self, initial_data):
+        conn = self._conn()
+        with conn:
+            for category in initial_data.get("categories", []):
+                conn.execute("INSERT INTO categories (id, name, extra) VALUES (?, ?, ?)",
+                             [category["id"]] + _split_record(category, CATEGORY_COLUMNS))
+            for product in initial_data.get("products", []):
+                conn.execute("INSERT INTO products (id, name, price, quantity, categoryId, createdAt, extra) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [product["id"]] + _split_record(product, PRODUCT_COLUMNS))
+                conn.execute(SQL_INDEX_NAME, (product["id"], fold(product.get("name", ""))))
+
+    def _record_change(self, conn, op, collection, record_id, record=None):
+        # Chamado dentro da transação da alteração: numera e grava no feed
+        conn.execute(SQL_BUMP_VERSION)
+        version = conn.execute(SQL_GET_VERSION).fetchone()[0]
+        conn.execute(SQL_SET_COLLECTION_VERSION, (collection, version, time.time()))
+        conn.execute(SQL_INSERT_CHANGE, (version, op, collection, record_id,
+                                         json.dumps(record) if record is not None else None))
+        conn.execute(SQL_PRUNE_CHANGES, (version - CHANGELOG_SIZE,))
+        if collection == "products" and op == "put":
+            conn.execute(SQL_SET_PRODUCT_REV, (version, record_id))
+        return version
+
+    def current_seq(self):
+        return self.epoch, self._conn().execute(SQL_GET_VERSION).fetchone()[0]
+
+    def changes_since(self, epoch, since, limit=1000):
+        # Mesmo contrato do JsonStore.changes_since
+        conn = self._conn()
+        version = conn.execute(SQL_GET_VERSION).fetchone()[0]
+        oldest = conn.execute(SQL_OLDEST_CHANGE).fetchone()[0]
+        if oldest is None:
+            oldest = version + 1
+        if epoch != self.epoch or since > version or since < oldest - 1:
+            return {"epoch": self.epoch, "version": version, "reset": True, "changes": []}
+        changes = []
+        for seq, op, collection, record_id, record in conn.execute(SQL_CHANGES_SINCE, (since, limit)):
+            change = {"seq": seq, "op": op, "collection": collection, "id": record_id}
+            if record is not None:
+                change["record"] = json.loads(record)
+            changes.append(change)
+        version = changes[-1]["seq"] if changes else since
+        return {"epoch": self.epoch, "version": version, "reset": False, "changes": changes}
+
+    def wait_for_changes(self, since, timeout, poll_interval=0.25):
+        # Outros processos também escrevem no banco: só dá para consultar periodicamente
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.current_seq()[1] > since:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll_interval, remaining))
+
+    def collection_state(self, collection):
+        version, changed_at = self._conn().execute(SQL_GET_COLLECTION_VERSION, (collection,)).fetchone()
+        return f"{self.epoch}-{version}", changed_at
+
+    def product_etag(self, product_id):
+        row = self._conn().execute(SQL_GET_PRODUCT_REV, (product_id,)).fetchone()
+        return f"{self.epoch}-{row[0]}" if row else None
+
+    def list_products(self):
+        rows = self._conn().execute(SQL_LIST_PRODUCTS)
+        return [_row_to_record(row, PRODUCT_COLUMNS) for row in rows]
+
+    def get_product(self, product_id):
+        row = self._conn().execute(SQL_GET_PRODUCT, (product_id,)).fetchone()
+        return _row_to_record(row, PRODUCT_COLUMNS) if row else None
+
+    def iter_products(self, batch_size=1000):
+        # Paginação por id: nenhuma transação de leitura fica aberta entre os lotes
+        conn = self._conn()
+        after = 0
+        while True:
+            rows = conn.execute(SQL_PRODUCTS_AFTER, (after, batch_size)).fetchall()
+            if not rows:
+                return
+            yield [_row_to_record(row, PRODUCT_COLUMNS) for row in rows]
+            after = rows[-1][0]
+
+    def create_product(self, product):
+        product.pop("id", None)
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(SQL_INSERT_PRODUCT, _split_record(product, PRODUCT_COLUMNS))
+            conn.execute(SQL_INDEX_NAME, (cursor.lastrowid, fold(product.get("name", ""))))
+            product = {"id": cursor.lastrowid, **product}
+            self._record_change(conn, "put", "products", product["id"], product)
+        return product
+
+    def update_product(self, product_id, changes):
+        conn = self._conn()
+        with conn:
+            # Leitura e escrita na mesma transação, já com o lock de escrita:
+            # dois PUTs simultâneos não perdem as alterações um do outro
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(SQL_GET_PRODUCT, (product_id,)).fetchone()
+            if row is None:
+                return None
+            product = _row_to_record(row, PRODUCT_COLUMNS)
+            changes.pop("id", None)
+            product.update(changes)
+            conn.execute(SQL_UPDATE_PRODUCT, _split_record(product, PRODUCT_COLUMNS) + [product_id])
+            conn.execute(SQL_INDEX_NAME, (product_id, fold(product.get("name", ""))))
+            self._record_change(conn, "put", "products", product_id, product)
+        return product
+
+    def query(self, name=None, category_id=None, min_price=None, max_price=None,
+              sort="id", descending=False, limit=None, after=None):
+        # Mesmo contrato do JsonStore.query; paginação por keyset (chave, id)
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Ordenação inválida: {sort}")
+        clauses, params = [], []
+        if name:
+            clauses.append("instr(casefold(name), ?) > 0")
+            params.append(name.casefold())
+        if category_id is not None:
+            clauses.append("categoryId = ?")
+            params.append(category_id)
+        if min_price is not None:
+            clauses.append(f"{SQL_SORT_KEYS['price']} >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            clauses.append(f"{SQL_SORT_KEYS['price']} <= ?")
+            params.append(max_price)
+        sort_key = SQL_SORT_KEYS[sort]
+        if after is not None:
+            clauses.append(f"({sort_key}, id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        sql = SQL_SELECT_PRODUCTS
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {sort_key} {direction}, id {direction}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        items = [_row_to_record(row, PRODUCT_COLUMNS) for row in self._conn().execute(sql, params)]
+        if limit is None or len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        last = items[-1]
+        return items, (SORT_KEYS[sort](last), last["id"])
+
+    def search(self, text, limit=20):
+        query = fold(text).strip()
+        if not query:
+            return []
+        params = {"q": query, "limit": limit}
+        if len(query) >= 3:
+            # O tokenizer trigram do FTS5 resolve a substring pelo índice
+            params["phrase"] = '"' + query.replace('"', '""') + '"'
+            rows = self._conn().execute(SQL_SEARCH_TRIGRAM, params)
+        else:
+            rows = self._conn().execute(SQL_SEARCH_PREFIX, params)
+        return [_row_to_record(row, PRODUCT_COLUMNS) for row in rows]
+
+    def category_totals(self):
+        rows = self._conn().execute(SQL_CATEGORY_TOTALS)
+        return [
+            {"categoryId": category_id, "count": count, "quantity": quantity, "priceSum": price_sum}
+            for category_id, count, quantity, price_sum in rows
+        ]
+
+    def price_histogram(self, bins):
+        # Mesmas faixas do SortedIndex.histogram; aqui o GROUP BY percorre a tabela (O(n))
+        conn = self._conn()
+        low, high = conn.execute(SQL_PRICE_RANGE).fetchone()
+        if low is None:
+            return [], []
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        width = (high - low) / bins
+        counts = [0] * bins
+        for bucket, count in conn.execute(SQL_PRICE_BUCKETS, {"low": low, "width": width, "last": bins - 1}):
+            counts[bucket] += count
+        return [low + width * i for i in range(bins)] + [high], counts
+
+    def delete_product(self, product_id):
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(SQL_DELETE_PRODUCT, (product_id,))
+            if cursor.rowcount == 0:
+                return False
+            conn.execute(SQL_UNINDEX_NAME, (product_id,))
+            self._record_change(conn, "delete", "products", product_id)
+        return True
+
+    def bulk_create_products(self, products):
+        conn = self._conn()
+        created = []
+        with conn:
+            for product in products:
+                product.pop("id", None)
+                cursor = conn.execute(SQL_INSERT_PRODUCT, _split_record(product, PRODUCT_COLUMNS))
+                conn.execute(SQL_INDEX_NAME, (cursor.lastrowid, fold(product.get("name", ""))))
+                product = {"id": cursor.lastrowid, **product}
+                self._record_change(conn, "put", "products", product["id"], product)
+                created.append(product)
+        return created
+
+    def bulk_update_products(self, updates):
+        conn = self._conn()
+        updated = []
+        # Uma única transação: qualquer id inexistente desfaz o lote inteiro
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            missing = []
+            for product_id, changes in updates:
+                row = conn.execute(SQL_GET_PRODUCT, (product_id,)).fetchone()
+                if row is None:
+                    missing.append(product_id)
+                    continue
+                product = _row_to_record(row, PRODUCT_COLUMNS)
+                changes.pop("id", None)
+                product.update(changes)
+                conn.execute(SQL_UPDATE_PRODUCT, _split_record(product, PRODUCT_COLUMNS) + [product_id])
+                conn.execute(SQL_INDEX_NAME, (product_id, fold(product.get("name", ""))))
+                self._record_change(conn, "put", "products", product_id, product)
+                updated.append(product)
+            if missing:
+                raise MissingRecordsError(missing)
+        return updated
+
+    def bulk_delete_products(self, product_ids):
+        conn = self._conn()
+        product_ids = list(dict.fromkeys(product_ids))
+        with conn:
+            missing = []
+            for product_id in product_ids:
+                if conn.execute(SQL_DELETE_PRODUCT, (product_id,)).rowcount == 0:
+                    missing.append(product_id)
+                    continue
+                conn.execute(SQL_UNINDEX_NAME, (product_id,))
+                self._record_change(conn, "delete", "products", product_id)
+            if missing:
+                raise MissingRecordsError(missing)
+        return product_ids
+
+    def list_categories(self):
+        rows = self._conn().execute(SQL_LIST_CATEGORIES)
+        return [_row_to_record(row, CATEGORY_COLUMNS) for row in rows]
+
+    def create_category(self, category):
+        category.pop("id", None)
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(SQL_INSERT_CATEGORY, _split_record(category, CATEGORY_COLUMNS))
+            category = {"id": cursor.lastrowid, **category}
+            self._record_change(conn, "put", "categories", category["id"], category)
+        return category
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def open_store(initial_data, backend=None, writer=None):
+    # `writer` (ou STORAGE_WRITER) só se aplica ao backend json
+    backend = backend or os.environ.get("DB_BACKEND", "json")
+    if backend == "json":
+        return JsonStore(open_persistence(writer=writer), initial_data)
+    if backend == "sqlite":
+        return SQLiteStore(os.environ.get("SQLITE_PATH", "db.sqlite3"), initial_data)
+    raise ValueError(f"DB_BACKEND inválido: {backend} (use um de {BACKENDS})")
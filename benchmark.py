@@ -0,0 +1,956 @@
+"""Benchmarks de desempenho da API.
+
+Uso:
+    python benchmark.py <cenário> [opções]
+
+Cenários disponíveis: veja `python benchmark.py --help`.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime
+
+from api_common import avg_price_by_category, quantity_by_category
+from backends import JsonStore
+from charts import AVG_PRICE_BY_CATEGORY, PRICE_DISTRIBUTION, QUANTITY_BY_CATEGORY, ProductColumns
+from export import EXPORT_BATCH_SIZE, export_chunks, project
+from indexes import NameIndex
+from storage import (JournalPersistence, JsonFilePersistence, dumps_compact, load_json_streaming,
+                     write_snapshot)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def make_catalog(n_products, n_categories=20):
+    created_at = datetime.now().isoformat()
+    return {
+        "products": [
+            {
+                "id": i,
+                "name": f"Produto {i}",
+                "price": float(i % 5000) + 0.99,
+                "quantity": i % 100,
+                "categoryId": i % n_categories + 1,
+                "createdAt": created_at,
+            }
+            for i in range(1, n_products + 1)
+        ],
+        "categories": [
+            {"id": i, "name": f"Categoria {i}"} for i in range(1, n_categories + 1)
+        ],
+    }
+
+
+def timed(func, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples) * 1000
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000
+    print(f"{label:<40} p50={p50:10.4f} ms  p99={p99:10.4f} ms  n={len(samples)}")
+
+
+def parse_sizes(value):
+    return [int(float(v)) for v in value.split(",")]
+
+
+@scenario("post")
+def bench_post(args):
+    """Custo de um POST (persistência) conforme o catálogo cresce."""
+    for size in args.sizes:
+        data = make_catalog(size)
+        next_id = size + 1
+
+        def new_product(i):
+            return {
+                "id": next_id + i,
+                "name": f"Novo {i}",
+                "price": 10.0,
+                "quantity": 1,
+                "categoryId": 1,
+                "createdAt": datetime.now().isoformat(),
+            }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            modes = [("journal", JournalPersistence(
+                snapshot_path=os.path.join(tmp, "db.snapshot.json"),
+                journal_path=os.path.join(tmp, "db.journal"),
+                fsync=args.fsync,
+            ))]
+            if size <= args.max_rewrite:
+                modes.append(("json", JsonFilePersistence(os.path.join(tmp, "db.json"))))
+
+            for mode, persistence in modes:
+                if mode == "journal":
+                    persistence.load()
+                    persistence.seed(data)
+
+                def post(i):
+                    product = new_product(i)
+                    data["products"].append(product)
+                    persistence.write([("put", "products", product)], lambda: data)
+
+                # A reescrita completa é lenta demais para muitas amostras
+                repeat = args.repeat if mode == "journal" else min(args.repeat, 20)
+                samples = timed(post, repeat)
+                persistence.close()
+                del data["products"][size:]
+                report(f"{mode} fsync={args.fsync if mode == 'journal' else '-'} n={size}", samples)
+
+
+class MemoryPersistence:
+    # Persistência nula: isola o custo das estruturas em memória
+    def __init__(self, data):
+        self.data = data
+
+    def load(self):
+        return self.data
+
+    def seed(self, data):
+        pass
+
+    def append(self, mutations, snapshot):
+        return None
+
+    def sync(self, token):
+        pass
+
+    def write(self, mutations, snapshot):
+        pass
+
+    def close(self):
+        pass
+
+
+class LegacyListStore:
+    # Implementação original das rotas (varreduras lineares em listas)
+    def __init__(self, data):
+        self.data = data
+
+    def get_product(self, product_id):
+        return next((p for p in self.data["products"] if p["id"] == product_id), None)
+
+    def update_product(self, product_id, changes):
+        product = self.get_product(product_id)
+        product.update(changes)
+        return product
+
+    def create_product(self, product):
+        product["id"] = max(p["id"] for p in self.data["products"]) + 1
+        self.data["products"].append(product)
+        return product
+
+    def delete_product(self, product_id):
+        self.data["products"] = [p for p in self.data["products"] if p["id"] != product_id]
+
+    def create_category(self, category):
+        category["id"] = max(c["id"] for c in self.data["categories"]) + 1
+        self.data["categories"].append(category)
+        return category
+
+
+@scenario("routes")
+def bench_routes(args):
+    """Custo de cada rota por id, em memória, no JsonStore e na versão original."""
+    import random
+    rng = random.Random(42)
+    for size in args.sizes:
+        stores = [
+            ("indexado", JsonStore(MemoryPersistence(make_catalog(size)), {})),
+            ("original", LegacyListStore(make_catalog(size))),
+        ]
+        for label, store in stores:
+            # A versão original é O(n) por chamada: menos amostras
+            repeat = args.repeat if label == "indexado" else max(5, min(args.repeat, 2_000_000 // size))
+            ids = [rng.randint(1, size) for _ in range(repeat)]
+            operations = [
+                ("GET /products/<id>", lambda i: store.get_product(ids[i])),
+                ("PUT /products/<id>", lambda i: store.update_product(ids[i], {"quantity": i})),
+                ("POST /products", lambda i: store.create_product({"name": f"Novo {i}", "price": 1.0})),
+                ("DELETE /products/<id>", lambda i: store.delete_product(ids[i])),
+                ("POST /categories", lambda i: store.create_category({"name": f"Nova {i}"})),
+            ]
+            for route, operation in operations:
+                report(f"{label} {route} n={size}", timed(operation, repeat))
+
+
+PRODUCT_WORDS = [
+    "Café", "Açúcar", "Pão", "Maçã", "Feijão", "Arroz", "Óleo", "Sabão", "Limão", "Melão",
+    "Notebook", "Monitor", "Teclado", "Cadeira", "Mesa", "Caneca", "Garrafa", "Panela",
+    "Elétrico", "Orgânico", "Integral", "Cristal", "Premium", "Econômico", "Grande", "Pequeno",
+]
+
+
+@scenario("search")
+def bench_search(args):
+    """Latência de /products/search no índice de trigramas."""
+    import random
+    rng = random.Random(42)
+    queries = ["cafe", "açúcar org", "pao integral", "monitor 12", "limao", "ca", "xyz", "elétrico 99"]
+    for size in args.sizes:
+        records = [
+            {"id": i, "name": " ".join(rng.sample(PRODUCT_WORDS, 3)) + f" {rng.randint(1, 99999)}"}
+            for i in range(1, size + 1)
+        ]
+        start = time.perf_counter()
+        index = NameIndex(records)
+        print(f"construção do índice n={size}: {(time.perf_counter() - start) * 1000:.0f} ms")
+        for query in queries:
+            report(f"q={query!r} n={size}", timed(lambda i: index.search(query, 20), args.repeat))
+
+
+@scenario("bulk")
+def bench_bulk(args):
+    """Importação de um catálogo: POST /products/bulk contra um POST por item."""
+    for size in args.sizes:
+        rows = make_catalog(size)["products"]
+        for row in rows:
+            del row["id"]
+        for mode in ("json", "journal"):
+            with tempfile.TemporaryDirectory() as tmp:
+                def open_json_store():
+                    if mode == "json":
+                        persistence = JsonFilePersistence(os.path.join(tmp, "db.json"))
+                    else:
+                        persistence = JournalPersistence(
+                            snapshot_path=os.path.join(tmp, "db.snapshot.json"),
+                            journal_path=os.path.join(tmp, "db.journal"),
+                            fsync=args.fsync,
+                        )
+                    return JsonStore(persistence, {"products": [], "categories": []})
+
+                store = open_json_store()
+                start = time.perf_counter()
+                store.bulk_create_products([dict(row) for row in rows])
+                bulk_elapsed = time.perf_counter() - start
+                store.close()
+
+                # Item a item o custo cresce com o catálogo (quadrático no modo json): mede
+                # uma amostra com o catálogo pela metade, o custo médio, e extrapola
+                store = open_json_store()
+                sample = rows[:min(size, args.loop_sample)]
+                if len(sample) < size:
+                    store.bulk_create_products([dict(row) for row in rows[:size // 2]])
+                start = time.perf_counter()
+                for row in sample:
+                    store.create_product(dict(row))
+                loop_elapsed = (time.perf_counter() - start) * size / len(sample)
+                store.close()
+
+                estimated = " (estimado)" if len(sample) < size else ""
+                print(f"{mode:<8} n={size:<8} lote={bulk_elapsed:8.2f} s  "
+                      f"item a item={loop_elapsed:10.2f} s{estimated}")
+
+
+@scenario("export")
+def bench_export(args):
+    """Memória de pico e primeiro byte: jsonify da lista inteira contra /products/export."""
+    for size in args.sizes:
+        store = JsonStore(MemoryPersistence(make_catalog(size)), {})
+
+        def whole_body():
+            # O que jsonify(store.list_products()) faz: o corpo inteiro antes do 1º byte
+            yield json.dumps(store.list_products())
+
+        exports = [
+            ("jsonify (antigo)", whole_body),
+            ("export ndjson", lambda: export_chunks("ndjson", store.iter_products(EXPORT_BATCH_SIZE))),
+            ("export csv", lambda: export_chunks("csv", store.iter_products(EXPORT_BATCH_SIZE))),
+        ]
+        for label, chunks in exports:
+            start = time.perf_counter()
+            stream = chunks()
+            next(stream)
+            first_byte = time.perf_counter() - start
+            for _ in stream:
+                pass
+            total = time.perf_counter() - start
+
+            tracemalloc.start()
+            for _ in chunks():
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{label + ' n=' + str(size):<40} 1º byte={first_byte * 1000:9.1f} ms  "
+                  f"total={total * 1000:9.1f} ms  pico={peak / 2**20:8.1f} MiB")
+
+
+def legacy_chart_data(products, categories):
+    # Agregações que o main.py fazia no cliente para os três gráficos
+    quantities, prices = {}, {}
+    for product in products:
+        category_name = next(
+            (cat["name"] for cat in categories if cat["id"] == product.get("categoryId")),
+            "Sem categoria"
+        )
+        quantities[category_name] = quantities.get(category_name, 0) + product["quantity"]
+        prices.setdefault(category_name, []).append(product["price"])
+    averages = {k: sum(v) / len(v) for k, v in prices.items()}
+    return quantities, averages, [p["price"] for p in products]
+
+
+@scenario("stats")
+def bench_stats(args):
+    """Dados dos gráficos: laços no cliente, colunas NumPy no cliente e totais do store (/stats)."""
+    for size in args.sizes:
+        data = make_catalog(size)
+        store = JsonStore(MemoryPersistence(data), {})
+        products, categories = store.list_products(), store.list_categories()
+        legacy = timed(lambda i: legacy_chart_data(products, categories), min(args.repeat, 5))
+        report(f"cliente (antigo) n={size}", legacy)
+        # Colunas montadas uma vez por versão dos dados; depois só bincount/histogram
+        report(f"colunas numpy: montagem n={size}", timed(
+            lambda i: ProductColumns(products), min(args.repeat, 5)))
+        columns = ProductColumns(products)
+        names = {category["id"]: category["name"] for category in categories}
+        report(f"colunas numpy: 3 gráficos n={size}", timed(lambda i: [
+            columns.chart_data(chart_type, names, 10)
+            for chart_type in (QUANTITY_BY_CATEGORY, AVG_PRICE_BY_CATEGORY, PRICE_DISTRIBUTION)
+        ], min(args.repeat, 50)))
+        report(f"/stats/quantity-by-category n={size}", timed(
+            lambda i: quantity_by_category(store.category_totals(), store.list_categories()), args.repeat))
+        report(f"/stats/avg-price-by-category n={size}", timed(
+            lambda i: avg_price_by_category(store.category_totals(), store.list_categories()), args.repeat))
+        report(f"/stats/price-histogram n={size}", timed(lambda i: store.price_histogram(10), args.repeat))
+        # Custo das escritas, que agora também atualizam os totais
+        report(f"update_product n={size}", timed(
+            lambda i: store.update_product(i % size + 1, {"price": float(i), "quantity": i % 7}), args.repeat))
+
+
+def legacy_products_list(list_view, products, categories):
+    # update_products_list original: recria um ListTile (com dois botões) por produto
+    import flet as ft
+    list_view.controls.clear()
+    for product in sorted(products, key=lambda x: x["name"]):
+        category_name = next(
+            (cat["name"] for cat in categories if cat["id"] == product.get("categoryId")),
+            "Sem categoria"
+        )
+        created_at = datetime.fromisoformat(product["createdAt"]).strftime("%d/%m/%Y %H:%M")
+        list_view.controls.append(ft.ListTile(
+            title=ft.Text(product["name"]),
+            subtitle=ft.Text(
+                f"Preço: R${product['price']:.2f} | "
+                f"Quantidade: {product['quantity']} | "
+                f"Categoria: {category_name}\n"
+                f"Cadastrado em: {created_at}"
+            ),
+            trailing=ft.Row(
+                controls=[
+                    ft.IconButton(icon="EDIT", tooltip="Editar", on_click=lambda e, p=product: None),
+                    ft.IconButton(icon="DELETE", tooltip="Excluir", on_click=lambda e, p=product: None,
+                                  icon_color="red"),
+                ],
+                width=100,
+            ),
+        ))
+
+
+def recording_page():
+    """ft.Page sem interface conectada; `conn.sent` soma os bytes que cada update enviaria."""
+    import asyncio
+    import flet as ft
+    from flet_core.local_connection import LocalConnection
+    from flet_core.protocol import CommandEncoder, PageCommandsBatchResponsePayload
+
+    class RecordingConnection(LocalConnection):
+        def __init__(self):
+            super().__init__()
+            self.page = None
+            self.sent = 0
+
+        def _get_next_control_id(self):
+            return self.page.get_next_control_id()
+
+        def send_commands(self, session_id, commands):
+            results, messages = [], []
+            for command in commands:
+                result, message = self._process_command(command)
+                if command.name in ("add", "get"):
+                    results.append(result)
+                if message:
+                    messages.append(message)
+            self.sent += len(json.dumps(messages, cls=CommandEncoder, separators=(",", ":")))
+            return PageCommandsBatchResponsePayload(results=results, error="")
+
+    conn = RecordingConnection()
+    page = conn.page = ft.Page(conn, "benchmark", asyncio.new_event_loop())
+    return page, conn
+
+
+@scenario("list")
+def bench_list(args):
+    """Lista de produtos do cliente: bytes enviados à interface e tempo de cada atualização."""
+    import flet as ft
+    from catalog import Catalog
+    from product_list import ProductList
+
+    for size in args.sizes:
+        data = make_catalog(size)
+        products, categories = data["products"], data["categories"]
+        catalog = Catalog()
+        catalog.set_categories(categories)
+
+        page, conn = recording_page()
+        legacy = ft.ListView(height=400)
+        page.add(legacy)
+        product_list = ProductList(50, "Nenhum produto cadastrado.", catalog, on_edit=print, on_delete=print,
+                                   height=400)
+        page.add(product_list.view)
+
+        def measure(label, update):
+            sent = conn.sent
+            start = time.perf_counter()
+            update()
+            page.update()
+            elapsed = time.perf_counter() - start
+            print(f"{label + ' n=' + str(size):<44} {elapsed * 1000:10.1f} ms  {(conn.sent - sent) / 1024:10.1f} KiB")
+
+        measure("antigo: carga", lambda: legacy_products_list(legacy, products, categories))
+        products[0] = dict(products[0], price=products[0]["price"] + 1)
+        measure("antigo: 1 produto alterado", lambda: legacy_products_list(legacy, products, categories))
+        legacy.controls.clear()
+        page.update()
+
+        def load():
+            catalog.set_products(products)
+            product_list.set_items(catalog.sorted_products)
+        measure("janela: carga", load)
+        products[0] = dict(products[0], price=products[0]["price"] + 1)
+        measure("janela: recarga com 1 alterado", load)
+        # Alterações pontuais (feed de /changes): só o tile do produto muda
+        products[0] = dict(products[0], price=products[0]["price"] + 1)
+        measure("diff: 1 produto alterado", lambda: product_list.patch(*catalog.put_product(products[0]), products[0]))
+        new_product = dict(products[0], id=size + 1, name="AAA novo")
+        measure("diff: produto novo no topo", lambda: product_list.patch(*catalog.put_product(new_product), new_product))
+        measure("diff: exclusão", lambda: product_list.patch(catalog.remove_product(size + 1), None))
+
+        def next_page():
+            product_list.window += product_list.page_size
+            product_list.render()
+        measure("janela: próxima página (rolagem)", next_page)
+
+
+@scenario("warmstart")
+def bench_warmstart(args):
+    """Abertura do cliente: catálogo lido do cache local (SQLite) contra GET /products + /categories."""
+    from api_client import ApiClient
+    from catalog import Catalog
+    from client_cache import ClientCache
+
+    for size in args.sizes:
+        data = make_catalog(size)
+        products, categories = data["products"], data["categories"]
+        repeat = min(args.repeat, 5)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ClientCache(os.path.join(tmp, "client_cache.sqlite3"))
+            report(f"cache: gravação completa n={size}", timed(
+                lambda i: cache.replace(products, categories, "bench", 1), repeat))
+            report(f"cache: 1 alteração do feed n={size}", timed(lambda i: cache.apply(
+                [{"collection": "products", "op": "put", "id": 1, "record": dict(products[0], price=float(i))}],
+                "bench", i), args.repeat))
+
+            def from_cache(i):
+                saved = cache.load()
+                catalog = Catalog()
+                catalog.set_categories(saved["categories"])
+                catalog.set_products(saved["products"])
+            report(f"abertura pelo cache n={size}", timed(from_cache, repeat))
+            cache.close()
+
+            snapshot = os.path.join(tmp, "db.snapshot")
+            write_snapshot(snapshot, data, 0, "binary")
+            env = {"STORAGE_MODE": "journal", "SNAPSHOT_FORMAT": "binary", "DB_SNAPSHOT_PATH": snapshot,
+                   "DB_JOURNAL_PATH": os.path.join(tmp, "db.journal"), "API_SERVER": "waitress"}
+            server, base_url, _ = start_server(env)
+            api = ApiClient()
+            try:
+                def from_server(i):
+                    catalog = Catalog()
+                    catalog.set_categories(api.get(f"{base_url}/categories").json())
+                    catalog.set_products(api.get(f"{base_url}/products").json())
+                report(f"abertura pelo servidor n={size}", timed(from_server, repeat))
+            finally:
+                api.close()
+                stop_server(server)
+
+
+@scenario("catalog")
+def bench_catalog(args):
+    """Modelo local do cliente: buscas lineares por categoria contra os índices do Catalog."""
+    from catalog import Catalog
+
+    for size in args.sizes:
+        data = make_catalog(size, args.categories)
+        products, categories = data["products"], data["categories"]
+        repeat = min(args.repeat, 5)
+
+        def legacy_pass(i):
+            # Nome da categoria e data formatada de cada produto, como o cliente fazia
+            for product in products:
+                next((cat["name"] for cat in categories if cat["id"] == product.get("categoryId")),
+                     "Sem categoria")
+                datetime.fromisoformat(product["createdAt"]).strftime("%d/%m/%Y %H:%M")
+        report(f"antigo: nomes e datas n={size}", timed(legacy_pass, repeat))
+
+        catalog = Catalog()
+        catalog.set_categories(categories)
+        report(f"catalog: carga n={size}", timed(lambda i: catalog.set_products(products), repeat))
+
+        def catalog_pass(i):
+            for product in catalog.sorted_products:
+                catalog.category_names.get(product.get("categoryId"), "Sem categoria")
+                catalog.created_label(product)
+        report(f"catalog: nomes e datas n={size}", timed(catalog_pass, repeat))
+
+        def legacy_change(i):
+            # apply_changes antigo: dicionário e lista refeitos a cada alteração
+            by_id = {p["id"]: p for p in products}
+            by_id[i % size + 1] = dict(products[i % size], price=float(i))
+            return list(by_id.values())
+        report(f"antigo: 1 alteração n={size}", timed(legacy_change, args.repeat))
+        report(f"catalog: 1 alteração n={size}", timed(
+            lambda i: catalog.put_product(dict(products[i % size], price=float(i))), args.repeat))
+
+
+@scenario("livesearch")
+def bench_livesearch(args):
+    """Pesquisa do cliente enquanto se digita: varredura do catálogo a cada tecla contra o LiveSearch."""
+    from catalog import Catalog
+    from live_search import LiveSearch, SearchQuery
+
+    typed = "produto 12345"
+    for size in args.sizes:
+        catalog = Catalog()
+        catalog.set_products(make_catalog(size)["products"])
+        # Uma consulta por tecla; a última também restringe o preço
+        queries = [SearchQuery(typed[:n], None, None, None) for n in range(1, len(typed) + 1)]
+        queries.append(queries[-1]._replace(min_price=100.0))
+        repeat = min(args.repeat, 5)
+
+        def full_scan(i):
+            for query in queries:
+                list(filter(query.matcher(), catalog.product_snapshot()))
+        samples = timed(full_scan, repeat)
+        report(f"varredura: por tecla n={size}", [s / len(queries) for s in samples])
+
+        live = LiveSearch(catalog)
+
+        def narrowing(i):
+            live.reset()
+            for query in queries:
+                live.run(query)
+        samples = timed(narrowing, repeat)
+        report(f"live: por tecla n={size}", [s / len(queries) for s in samples])
+
+        def keystroke(i):
+            # Pior caso de uma tecla: primeira letra, sem resultado anterior para refinar
+            live.reset()
+            live.run(queries[0])
+        report(f"live: primeira tecla n={size}", timed(keystroke, repeat))
+
+
+@scenario("encode")
+def bench_encode(args):
+    """Custo e tamanho de GET /products: serialização, compressão e cache do corpo."""
+    import gzip
+    from api_common import BROTLI_QUALITY, GZIP_LEVEL, brotli
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+    for size in args.sizes:
+        products = make_catalog(size)["products"]
+        repeat = max(3, min(args.repeat, 20_000_000 // size))
+        body = json.dumps(products, separators=(",", ":"), sort_keys=True).encode()
+        encoders = [
+            # O que o jsonify faz por padrão (compacto, chaves ordenadas)
+            ("jsonify padrão", lambda: json.dumps(products, separators=(",", ":"), sort_keys=True).encode()),
+            ("indent=2 (antigo)", lambda: json.dumps(products, indent=2).encode()),
+            ("dumps_compact", lambda: dumps_compact(products).encode()),
+            ("dumps_compact fields=id,name,price",
+             lambda: dumps_compact([project(p, ("id", "name", "price")) for p in products]).encode()),
+        ]
+        if orjson is not None:
+            encoders.append(("orjson", lambda: orjson.dumps(products)))
+        encoders.append(("gzip", lambda: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)))
+        if brotli is not None:
+            encoders.append(("brotli", lambda: brotli.compress(body, quality=BROTLI_QUALITY)))
+        encoders.append(("cache (cópia)", lambda: bytearray(body)))
+        for label, encode in encoders:
+            output = encode()
+            samples = timed(lambda i: encode(), repeat)
+            report(f"{label} n={size} ({len(output) / 2**20:.1f} MiB)", samples)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env, timeout=600, script="api_server.py"):
+    # Sobe a API (api_server.py ou api_asgi.py) e espera a primeira resposta 200:
+    # (processo, url base, tempo)
+    port = free_port()
+    env = dict(os.environ, API_PORT=str(port), API_DEBUG="0", **env)
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, script)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(f"{base_url}/categories", timeout=1) as resp:
+                if resp.status == 200:
+                    return server, base_url, time.perf_counter() - start
+        except OSError:
+            time.sleep(0.02)
+    stop_server(server)
+    raise TimeoutError("servidor não respondeu")
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
+
+
+def time_to_first_request(env, timeout=600):
+    server, _, elapsed = start_server(env, timeout)
+    stop_server(server)
+    return elapsed
+
+
+@scenario("startup")
+def bench_startup(args):
+    """Tempo de carga do armazenamento e time-to-first-request do servidor."""
+    serve = importlib.util.find_spec("flask") is not None
+    if not serve:
+        print("flask não instalado: medindo apenas a carga em processo")
+    for size in args.sizes:
+        data = make_catalog(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "db.json")
+            JsonFilePersistence(db_path).seed(data)
+            snapshots = {}
+            for fmt in ("json", "binary"):
+                snapshots[fmt] = os.path.join(tmp, f"db.snapshot.{fmt}")
+                write_snapshot(snapshots[fmt], data, 0, fmt)
+
+            def load_json(path=db_path):
+                with open(path, encoding="utf-8") as f:
+                    return json.load(f)
+
+            def load_journal(fmt):
+                persistence = JournalPersistence(snapshot_path=snapshots[fmt],
+                                                 journal_path=os.path.join(tmp, "db.journal"))
+                loaded = persistence.load()
+                persistence.close()
+                return loaded
+
+            loaders = [
+                ("json.load (antigo)", load_json),
+                ("json incremental", lambda: load_json_streaming(db_path)),
+                ("journal snapshot json", lambda: load_journal("json")),
+                ("journal snapshot binário", lambda: load_journal("binary")),
+            ]
+            for label, loader in loaders:
+                samples = timed(lambda i: loader(), 3)
+                report(f"carga {label} n={size}", samples)
+
+            if serve:
+                servers = [
+                    ("json", {"STORAGE_MODE": "json", "DB_PATH": db_path}),
+                    ("journal binário", {"STORAGE_MODE": "journal",
+                                         "DB_SNAPSHOT_PATH": snapshots["binary"],
+                                         "DB_JOURNAL_PATH": os.path.join(tmp, "db.journal")}),
+                ]
+                for label, env in servers:
+                    elapsed = time_to_first_request(env)
+                    print(f"{'primeira requisição ' + label + ' n=' + str(size):<40} "
+                          f"{elapsed * 1000:9.1f} ms")
+
+
+class HttpClient:
+    # Cliente mínimo (urllib) para o teste de carga
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return json.loads(resp.read())
+
+
+class StoreClient:
+    # Mesmas operações direto no store, quando o flask não está instalado
+    def __init__(self, store):
+        self.store = store
+
+    def call(self, method, path, body=None):
+        parts = path.strip("/").split("/")
+        if method == "POST":
+            return self.store.create_product(body)
+        if method == "PUT":
+            return self.store.update_product(int(parts[1]), body)
+        if len(parts) == 2:
+            return self.store.get_product(int(parts[1]))
+        return self.store.query(sort="price", limit=20)[0]
+
+
+def run_load(client, n_clients, requests_per_client):
+    """Cada cliente cria produtos, altera o seu e um produto compartilhado, e lê.
+
+    No produto compartilhado cada alteração grava o mesmo valor (único por
+    cliente e rodada) em quantity e price: as respostas e o estado final
+    precisam ter sempre os dois campos vindos de uma mesma alteração, e no
+    fim o valor tem de ser a última alteração de algum cliente (a última
+    aplicada pelo servidor é necessariamente a última do cliente que a fez).
+
+    Devolve (requisições por segundo, problemas encontrados na verificação).
+    """
+    shared = client.call("POST", "/products", {"name": "Compartilhado", "price": 1.0})
+    rounds = max(1, requests_per_client // 5)
+    created = [[] for _ in range(n_clients)]
+    errors = []
+
+    def worker(k):
+        try:
+            for i in range(rounds):
+                product = client.call("POST", "/products", {"name": f"Carga {k}-{i}", "price": float(i)})
+                created[k].append(product["id"])
+                client.call("PUT", f"/products/{product['id']}", {"quantity": i})
+                value = k * rounds + i
+                updated = client.call("PUT", f"/products/{shared['id']}",
+                                      {"quantity": value, "price": float(value)})
+                if updated.get("price") != updated.get("quantity"):
+                    errors.append(f"cliente {k}: alteração misturada no produto compartilhado: {updated}")
+                client.call("GET", f"/products/{product['id']}")
+                client.call("GET", "/products?sort=price&limit=20")
+        except Exception as e:
+            errors.append(f"cliente {k}: {e!r}")
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(n_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ids = [product_id for ids in created for product_id in ids]
+    problems = list(errors)
+    if len(set(ids)) != len(ids):
+        problems.append(f"{len(ids) - len(set(ids))} ids duplicados")
+    final = client.call("GET", f"/products/{shared['id']}")
+    last_values = {k * rounds + rounds - 1 for k in range(n_clients)}
+    if final.get("quantity") not in last_values or final.get("price") != final.get("quantity"):
+        problems.append(f"alteração perdida no produto compartilhado: {final}")
+    for k, product_ids in enumerate(created):
+        for i, product_id in enumerate(product_ids):
+            if client.call("GET", f"/products/{product_id}").get("quantity") != i:
+                problems.append(f"alteração perdida no produto {product_id}")
+    return len(ids) * 5 / elapsed, problems
+
+
+@scenario("load")
+def bench_load(args):
+    """Teste de carga com clientes concorrentes: vazão e verificação de alterações perdidas."""
+    serve = importlib.util.find_spec("flask") is not None
+    if not serve:
+        print("flask não instalado: carga direto no JsonStore (journal), sem HTTP")
+    for n_clients in args.clients:
+        with tempfile.TemporaryDirectory() as tmp:
+            if serve:
+                env = {"STORAGE_MODE": "journal", "DB_BACKEND": args.backend, "API_SERVER": args.server,
+                       "API_THREADS": str(max(n_clients, 4)), "JOURNAL_FSYNC": args.fsync,
+                       "DB_SNAPSHOT_PATH": os.path.join(tmp, "db.snapshot.json"),
+                       "DB_JOURNAL_PATH": os.path.join(tmp, "db.journal"),
+                       "SQLITE_PATH": os.path.join(tmp, "db.sqlite3")}
+                server, base_url, _ = start_server(env)
+                client, label = HttpClient(base_url), f"{args.server}/{args.backend}"
+            else:
+                store = JsonStore(JournalPersistence(
+                    snapshot_path=os.path.join(tmp, "db.snapshot.json"),
+                    journal_path=os.path.join(tmp, "db.journal"),
+                    fsync=args.fsync,
+                ), make_catalog(1000))
+                client, label = StoreClient(store), "store/json"
+            try:
+                throughput, problems = run_load(client, n_clients, args.repeat)
+            finally:
+                if serve:
+                    stop_server(server)
+                else:
+                    store.close()
+            status = "ok" if not problems else "; ".join(problems[:3])
+            print(f"{label} clientes={n_clients:<4} {throughput:10.0f} req/s  verificação: {status}")
+
+
+async def http_call(conn, method, path, body=None):
+    # Uma requisição HTTP/1.1 numa conexão keep-alive já aberta; devolve o status
+    reader, writer = conn
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    headers = dict(line.lower().split(": ", 1) for line in head[1:] if ": " in line)
+    await reader.readexactly(int(headers.get("content-length", 0)))
+    return int(head[0].split()[1])
+
+
+async def async_load(port, n_clients, duration, n_products):
+    """Gerador de carga: `n_clients` conexões keep-alive, 80% GET, 10% POST, 10% PUT."""
+    import asyncio
+    import random
+    latencies = []
+    failures = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(k):
+        nonlocal failures
+        rng = random.Random(k)
+        conn = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < deadline:
+                roll = rng.random()
+                product_id = rng.randint(1, n_products)
+                start = time.perf_counter()
+                if roll < 0.8:
+                    status = await http_call(conn, "GET", f"/products/{product_id}")
+                elif roll < 0.9:
+                    status = await http_call(conn, "POST", "/products", {"name": f"Carga {k}", "price": 1.0})
+                else:
+                    status = await http_call(conn, "PUT", f"/products/{product_id}", {"quantity": k})
+                latencies.append(time.perf_counter() - start)
+                failures += status >= 400
+        finally:
+            conn[1].close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(k) for k in range(n_clients)))
+    return latencies, failures, time.perf_counter() - start
+
+
+@scenario("asgi")
+def bench_asgi(args):
+    """Flask (waitress) contra a versão ASGI (uvicorn) com muitas conexões simultâneas."""
+    import asyncio
+    servers = [
+        ("flask/waitress", "api_server.py", {"API_SERVER": "waitress", "STORAGE_WRITER": "inline"}),
+        ("asgi/uvicorn", "api_asgi.py", {"STORAGE_WRITER": "background"}),
+    ]
+    for size in args.sizes:
+        for n_clients in args.clients:
+            for label, script, server_env in servers:
+                with tempfile.TemporaryDirectory() as tmp:
+                    snapshot = os.path.join(tmp, "db.snapshot")
+                    write_snapshot(snapshot, make_catalog(size), 0, "binary")
+                    env = {"STORAGE_MODE": "journal", "SNAPSHOT_FORMAT": "binary", "JOURNAL_FSYNC": args.fsync,
+                           "DB_SNAPSHOT_PATH": snapshot, "DB_JOURNAL_PATH": os.path.join(tmp, "db.journal"),
+                           "API_THREADS": str(min(n_clients, 64)), **server_env}
+                    server, base_url, _ = start_server(env, script=script)
+                    try:
+                        port = int(base_url.rsplit(":", 1)[1])
+                        latencies, failures, elapsed = asyncio.run(
+                            async_load(port, n_clients, args.duration, size))
+                    finally:
+                        stop_server(server)
+                latencies.sort()
+                p50 = latencies[len(latencies) // 2] * 1000
+                p99 = latencies[int(len(latencies) * 0.99)] * 1000
+                print(f"{label:<15} n={size:<8} clientes={n_clients:<4} {len(latencies) / elapsed:8.0f} req/s  "
+                      f"p50={p50:8.2f} ms  p99={p99:8.2f} ms  erros={failures}")
+
+
+@scenario("client")
+def bench_client(args):
+    """Cliente do app: requests.get avulso (TCP novo a cada chamada) contra o ApiClient."""
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+    from api_client import ApiClient
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshot = os.path.join(tmp, "db.snapshot")
+            write_snapshot(snapshot, make_catalog(size), 0, "binary")
+            # waitress mantém a conexão aberta; o servidor de desenvolvimento do Flask (HTTP/1.0) não
+            env = {"STORAGE_MODE": "journal", "SNAPSHOT_FORMAT": "binary", "DB_SNAPSHOT_PATH": snapshot,
+                   "DB_JOURNAL_PATH": os.path.join(tmp, "db.journal"), "API_SERVER": "waitress"}
+            server, base_url, _ = start_server(env)
+            api = ApiClient()
+            pool = ThreadPoolExecutor(max_workers=2)
+            products_url, categories_url = f"{base_url}/products", f"{base_url}/categories"
+            try:
+                report(f"requests.get /categories n={size}", timed(
+                    lambda i: requests.get(categories_url), args.repeat))
+                report(f"ApiClient.get /categories n={size}", timed(
+                    lambda i: api.get(categories_url), args.repeat))
+
+                def parallel_load(i):
+                    products = pool.submit(api.get, products_url)
+                    api.get(categories_url)
+                    products.result()
+                repeat = min(args.repeat, 20)
+                report(f"carga inicial sequencial n={size}", timed(
+                    lambda i: (requests.get(products_url), requests.get(categories_url)), repeat))
+                report(f"carga inicial paralela n={size}", timed(parallel_load, repeat))
+                for line in api.latency_report():
+                    print(f"  {line}")
+            finally:
+                api.close()
+                pool.shutdown()
+                stop_server(server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("1e3,1e4,1e5,1e6"),
+                        help="tamanhos do catálogo separados por vírgula")
+    parser.add_argument("--repeat", type=int, default=200, help="amostras por tamanho")
+    parser.add_argument("--fsync", default="always", help="política de fsync do journal")
+    parser.add_argument("--loop-sample", type=int, default=1000,
+                        help="itens importados um a um no cenário bulk (o resto é extrapolado)")
+    parser.add_argument("--clients", type=parse_sizes, default=parse_sizes("1,8,32"),
+                        help="clientes simultâneos no cenário load")
+    parser.add_argument("--duration", type=float, default=10, help="segundos de carga no cenário asgi")
+    parser.add_argument("--server", default="waitress", help="API_SERVER no cenário load")
+    parser.add_argument("--backend", default="json", help="DB_BACKEND no cenário load")
+    parser.add_argument("--max-rewrite", type=int, default=100_000,
+                        help="maior catálogo testado no modo json (reescrita completa)")
+    parser.add_argument("--categories", type=int, default=20, help="categorias no cenário catalog")
+    args = parser.parse_args()
+    SCENARIOS[args.scenario](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import threading
+from bisect import bisect_left
+from datetime import datetime
+
+
+def sort_key(product):
+    return (product["name"], product["id"])
+
+
+class Catalog:
+    """Produtos e categorias do cliente, com os índices que a interface consulta.
+
+    - `products` e `categories`: id -> registro
+    - `category_names` (id -> nome) e `category_ids` (nome -> id)
+    - `sorted_products`: produtos em ordem de (nome, id), mantida com bisect a
+      cada alteração. A lista é sempre a mesma (alterada no lugar), então a
+      ProductList a exibe diretamente e só precisa das posições que mudaram.
+    - `created_label`: data de cadastro formatada, calculada uma vez por produto
+    - `version`: muda a cada alteração dos produtos
+
+    Tudo sob `lock` (RLock), que a ProductList da tela de cadastro compartilha.
+    """
+
+    def __init__(self):
+        self.products = {}
+        self.categories = {}
+        self.category_names = {}
+        self.category_ids = {}
+        # Nome em minúsculas -> id, para recusar categorias repetidas
+        self.category_keys = {}
+        self.sorted_products = []
+        self.keys = []
+        self.created_labels = {}
+        self.version = 0
+        self.lock = threading.RLock()
+
+    def set_products(self, products):
+        with self.lock:
+            ordered = sorted(products, key=sort_key)
+            self.products = {product["id"]: product for product in ordered}
+            self.sorted_products[:] = ordered
+            self.keys[:] = [sort_key(product) for product in ordered]
+            self.created_labels = {}
+            self.version += 1
+
+    def set_categories(self, categories):
+        with self.lock:
+            self.categories = {}
+            self.category_names = {}
+            self.category_ids = {}
+            self.category_keys = {}
+            for category in categories:
+                self.put_category(category)
+
+    def clear(self):
+        self.set_products([])
+        self.set_categories([])
+
+    def put_product(self, product):
+        """Insere ou substitui um produto; devolve (posição antiga, posição nova).
+
+        A posição antiga é None para um produto novo; as duas são iguais
+        quando o produto não saiu do lugar.
+        """
+        with self.lock:
+            self.version += 1
+            key = sort_key(product)
+            old = self.products.get(product["id"])
+            old_pos = None
+            if old is not None:
+                old_pos = bisect_left(self.keys, sort_key(old))
+                if self.keys[old_pos] == key:
+                    self.products[product["id"]] = self.sorted_products[old_pos] = product
+                    return old_pos, old_pos
+                del self.sorted_products[old_pos]
+                del self.keys[old_pos]
+            new_pos = bisect_left(self.keys, key)
+            self.sorted_products.insert(new_pos, product)
+            self.keys.insert(new_pos, key)
+            self.products[product["id"]] = product
+            return old_pos, new_pos
+
+    def remove_product(self, product_id):
+        """Remove o produto; devolve a posição que ele ocupava (None se não existia)."""
+        with self.lock:
+            product = self.products.pop(product_id, None)
+            if product is None:
+                return None
+            self.version += 1
+            pos = bisect_left(self.keys, sort_key(product))
+            del self.sorted_products[pos]
+            del self.keys[pos]
+            self.created_labels.pop(product_id, None)
+            return pos
+
+    def put_category(self, category):
+        with self.lock:
+            self.remove_category(category["id"])
+            self.categories[category["id"]] = category
+            self.category_names[category["id"]] = category["name"]
+            self.category_ids[category["name"]] = category["id"]
+            self.category_keys[category["name"].lower()] = category["id"]
+
+    def remove_category(self, category_id):
+        with self.lock:
+            category = self.categories.pop(category_id, None)
+            if category is None:
+                return
+            del self.category_names[category_id]
+            # Só desfaz o índice por nome se ele aponta para esta categoria
+            if self.category_ids.get(category["name"]) == category_id:
+                del self.category_ids[category["name"]]
+            if self.category_keys.get(category["name"].lower()) == category_id:
+                del self.category_keys[category["name"].lower()]
+
+    def has_category_name(self, name):
+        return name.lower() in self.category_keys
+
+    def category_list(self):
+        with self.lock:
+            return list(self.categories.values())
+
+    def product_snapshot(self):
+        # Cópia para quem lê fora da thread que altera (ex.: os gráficos)
+        with self.lock:
+            return list(self.sorted_products)
+
+    def created_label(self, product):
+        # Também serve aos resultados da pesquisa: a entrada vale enquanto o createdAt for o mesmo
+        cached = self.created_labels.get(product["id"])
+        if cached is None or cached[0] != product["createdAt"]:
+            label = datetime.fromisoformat(product["createdAt"]).strftime("%d/%m/%Y %H:%M")
+            cached = self.created_labels[product["id"]] = (product["createdAt"], label)
+        return cached[1]
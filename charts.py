@@ -0,0 +1,188 @@
+import collections
+import threading
+from io import BytesIO
+
+import numpy as np
+from matplotlib.figure import Figure
+
+# Gráficos da aba "Gráficos" do cliente (main.py).
+#
+# As funções render_* são puras: recebem os dados de /stats/... e devolvem os
+# bytes do PNG. Usam Figure direto (sem pyplot, que tem estado global), então
+# podem rodar em qualquer thread ou num processo do pool de renderização.
+
+QUANTITY_BY_CATEGORY = "Quantidade por Categoria"
+AVG_PRICE_BY_CATEGORY = "Preço Médio por Categoria"
+PRICE_DISTRIBUTION = "Distribuição de Preços"
+
+
+class ProductColumns:
+    """Produtos do cliente em colunas NumPy (preço, quantidade, categoria).
+
+    Caminho local dos dados dos gráficos, para quando /stats não responde:
+    os totais por categoria saem de np.bincount e o histograma de
+    np.histogram, sem laço Python por produto. As categorias viram códigos
+    0..k-1 (`category_ids[código]` é o categoryId, inclusive None).
+    """
+
+    def __init__(self, products):
+        n = len(products)
+        codes = {}
+        self.price = np.fromiter((p.get("price") or 0 for p in products), dtype=np.float64, count=n)
+        self.quantity = np.fromiter((p.get("quantity") or 0 for p in products), dtype=np.int64, count=n)
+        self.category = np.fromiter((codes.setdefault(p.get("categoryId"), len(codes)) for p in products),
+                                    dtype=np.intp, count=n)
+        self.category_ids = list(codes)
+
+    def category_totals(self):
+        # Mesmo formato do store.category_totals() do servidor
+        k = len(self.category_ids)
+        counts = np.bincount(self.category, minlength=k)
+        quantities = np.bincount(self.category, weights=self.quantity, minlength=k)
+        price_sums = np.bincount(self.category, weights=self.price, minlength=k)
+        return [
+            {"categoryId": category_id, "count": int(count), "quantity": int(quantity), "priceSum": float(price_sum)}
+            for category_id, count, quantity, price_sum in zip(self.category_ids, counts, quantities, price_sums)
+            if count
+        ]
+
+    def price_histogram(self, bins):
+        if not len(self.price):
+            return {"edges": [], "counts": []}
+        counts, edges = np.histogram(self.price, bins=bins)
+        return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+    def chart_data(self, chart_type, category_names, bins):
+        """Os dados que /stats/... devolveria para `chart_type` (`category_names`: id -> nome)."""
+        if chart_type == PRICE_DISTRIBUTION:
+            return self.price_histogram(bins)
+        rows = []
+        for row in self.category_totals():
+            row["name"] = category_names.get(row["categoryId"])
+            row["avgPrice"] = row["priceSum"] / row["count"]
+            rows.append(row)
+        return rows
+
+
+def merge_by_label(rows):
+    # Produtos sem categoria (ou de uma categoria que não existe) viram uma só barra
+    merged = {}
+    for row in rows:
+        label = row["name"] or "Sem categoria"
+        merged.setdefault(label, []).append(row)
+    return merged
+
+
+def _png(fig, dpi):
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches='tight', dpi=dpi)
+    return buf.getvalue()
+
+
+def _barh(values, color, value_format, title, xlabel, figsize, dpi):
+    # Barras horizontais ordenadas da maior para a menor, com o valor ao lado
+    sorted_categories = sorted(values.items(), key=lambda x: x[1], reverse=True)
+    categories = [x[0] for x in sorted_categories]
+    totals = [x[1] for x in sorted_categories]
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    bars = ax.barh(categories, totals, color=color)
+
+    for bar in bars:
+        width = bar.get_width()
+        ax.text(width + 0.3, bar.get_y() + bar.get_height()/2,
+                value_format(width),
+                va='center', ha='left')
+
+    ax.set_title(title, pad=20)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("Categoria")
+    fig.tight_layout()
+    return _png(fig, dpi)
+
+
+def render_quantity_by_category(rows, figsize, dpi):
+    category_quantities = {
+        label: sum(row["quantity"] for row in group)
+        for label, group in merge_by_label(rows).items()
+    }
+    return _barh(category_quantities, 'skyblue', lambda width: f'{int(width)}',
+                 "Quantidade de Produtos por Categoria", "Quantidade Total", figsize, dpi)
+
+
+def render_avg_price_by_category(rows, figsize, dpi):
+    # Média ponderada pelo número de produtos quando várias linhas viram o mesmo rótulo
+    category_avg = {
+        label: sum(row["avgPrice"] * row["count"] for row in group) / sum(row["count"] for row in group)
+        for label, group in merge_by_label(rows).items()
+    }
+    return _barh(category_avg, 'lightgreen', lambda width: f'R${width:.2f}',
+                 "Preço Médio por Categoria", "Preço Médio (R$)", figsize, dpi)
+
+
+def render_price_distribution(histogram, figsize, dpi):
+    edges, counts = histogram["edges"], histogram["counts"]
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    # As faixas já vêm contadas: cada uma entra com o seu total como peso
+    ax.hist(edges[:-1], bins=edges or 10, weights=counts,
+            color='orange', edgecolor='black')
+
+    ax.set_title("Distribuição de Preços dos Produtos", pad=20)
+    ax.set_xlabel("Preço (R$)")
+    ax.set_ylabel("Quantidade de Produtos")
+    fig.tight_layout()
+    return _png(fig, dpi)
+
+
+RENDERERS = {
+    QUANTITY_BY_CATEGORY: render_quantity_by_category,
+    AVG_PRICE_BY_CATEGORY: render_avg_price_by_category,
+    PRICE_DISTRIBUTION: render_price_distribution,
+}
+
+
+def render_chart(chart_type, data, figsize, dpi):
+    """PNG do gráfico `chart_type`; função de módulo para poder ir a um processo do pool."""
+    return RENDERERS[chart_type](data, figsize, dpi)
+
+
+class ChartCache:
+    """PNGs já renderizados, com descarte LRU por orçamento de bytes.
+
+    A chave inclui a versão dos dados, então entradas de versões antigas
+    nunca são servidas; `clear` só devolve a memória mais cedo.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            png = self.entries.get(key)
+            if png is not None:
+                self.entries.move_to_end(key)
+            return png
+
+    def put(self, key, png):
+        if len(png) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = png
+            self.size += len(png)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
@@ -0,0 +1,106 @@
+import json
+import sqlite3
+import threading
+
+# Cópia local do cliente (main.py) em SQLite: o último estado recebido do
+# servidor, a posição no feed /changes e as escritas feitas sem conexão.
+# Com ela o app abre mostrando o catálogo na hora, mesmo com a API fora do ar.
+
+CLIENT_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    key INTEGER PRIMARY KEY,
+    entry TEXT NOT NULL
+);
+"""
+
+# Uma carga completa vai como um só JSON e é expandida pelo próprio SQLite;
+# a leitura junta os registros num só texto para um único json.loads
+SQL_REPLACE_RECORDS = "INSERT INTO {} (id, record) SELECT json_extract(value, '$.id'), value FROM json_each(?)"
+SQL_LOAD_RECORDS = "SELECT '[' || IFNULL(group_concat(record, ','), '') || ']' FROM (SELECT record FROM {} ORDER BY id)"
+SQL_PUT_RECORD = "INSERT OR REPLACE INTO {} (id, record) VALUES (?, ?)"
+SQL_DELETE_RECORD = "DELETE FROM {} WHERE id = ?"
+SQL_SET_META = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+SQL_ENQUEUE = "INSERT OR REPLACE INTO outbox (key, entry) VALUES (?, ?)"
+SQL_DEQUEUE = "DELETE FROM outbox WHERE key = ?"
+
+COLLECTIONS = ("products", "categories")
+
+
+def _dumps(record):
+    return json.dumps(record, separators=(",", ":"))
+
+
+class ClientCache:
+    """Catálogo do cliente em SQLite (WAL), com uma só conexão protegida por lock.
+
+    `load` devolve o que foi salvo; `replace` grava uma carga completa e
+    `apply` as alterações do feed, sempre junto com a posição (epoch, seq)
+    correspondente. A fila (`enqueue`/`dequeue`) guarda as escritas ainda
+    não confirmadas pelo servidor, na ordem em que foram feitas.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(CLIENT_CACHE_SCHEMA)
+
+    def load(self):
+        with self.lock:
+            data = {
+                collection: json.loads(self.conn.execute(SQL_LOAD_RECORDS.format(collection)).fetchone()[0])
+                for collection in COLLECTIONS
+            }
+            data.update(self.conn.execute("SELECT key, value FROM meta"))
+            data["outbox"] = [json.loads(entry) for (entry,) in
+                              self.conn.execute("SELECT entry FROM outbox ORDER BY key")]
+        data.setdefault("epoch", None)
+        data.setdefault("seq", None)
+        return data
+
+    def replace(self, products, categories, epoch, seq):
+        with self.lock, self.conn:
+            for collection, records in zip(COLLECTIONS, (products, categories)):
+                self.conn.execute(f"DELETE FROM {collection}")
+                self.conn.execute(SQL_REPLACE_RECORDS.format(collection), (_dumps(records),))
+            self._set_position(epoch, seq)
+
+    def apply(self, changes, epoch, seq):
+        with self.lock, self.conn:
+            for change in changes:
+                if change["op"] == "put":
+                    self.conn.execute(SQL_PUT_RECORD.format(change["collection"]),
+                                      (change["id"], _dumps(change["record"])))
+                else:
+                    self.conn.execute(SQL_DELETE_RECORD.format(change["collection"]), (change["id"],))
+            self._set_position(epoch, seq)
+
+    def _set_position(self, epoch, seq):
+        self.conn.executemany(SQL_SET_META, (("epoch", epoch), ("seq", seq)))
+
+    def enqueue(self, entry):
+        with self.lock, self.conn:
+            self.conn.execute(SQL_ENQUEUE, (entry["key"], _dumps(entry)))
+
+    def dequeue(self, key):
+        with self.lock, self.conn:
+            self.conn.execute(SQL_DEQUEUE, (key,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
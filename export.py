@@ -0,0 +1,57 @@
+import csv
+import io
+
+from backends import PRODUCT_COLUMNS
+from storage import dumps_compact
+
+# Exportação do catálogo em streaming: cada lote de produtos vira um bloco de
+# texto, então a memória não cresce com o tamanho do catálogo
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_BATCH_SIZE = 1000
+
+
+def parse_fields(value):
+    # "id,name,price" -> ("id", "name", "price"); None quando não informado
+    if value is None:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    if not fields:
+        raise ValueError("fields deve listar ao menos um campo")
+    return fields
+
+
+def project(record, fields):
+    # Só os campos pedidos (e presentes) do registro; sem `fields`, o registro inteiro
+    if fields is None or record is None:
+        return record
+    return {f: record[f] for f in fields if f in record}
+
+
+def ndjson_chunks(batches, fields=None):
+    for batch in batches:
+        if fields is not None:
+            batch = [project(p, fields) for p in batch]
+        yield "".join(dumps_compact(p) + "\n" for p in batch)
+
+
+def csv_chunks(batches, fields=None):
+    # Sem `fields`, as colunas conhecidas; campos extras só saem se pedidos
+    fields = fields or PRODUCT_COLUMNS
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in batches:
+        writer.writerows([p.get(f) for f in fields] for p in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Catálogo vazio: só o cabeçalho
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_chunks(export_format, batches, fields=None):
+    if export_format == "csv":
+        return csv_chunks(batches, fields)
+    return ndjson_chunks(batches, fields)
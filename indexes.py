@@ -0,0 +1,349 @@
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+from product_filters import price_key
+
+# Índices secundários do JsonStore. Todos guardam só ids, nunca cópias dos
+# registros, e são atualizados a cada criação, alteração e exclusão.
+
+
+def name_key(product):
+    return str(product.get("name", ""))
+
+
+def id_key(product):
+    return product["id"]
+
+
+SORT_KEYS = {
+    "id": id_key,
+    "name": name_key,
+    "price": price_key,
+}
+
+
+class SortedIndex:
+    """Lista ordenada de (chave, id): busca por faixa e retomada de cursor em O(log n)."""
+
+    def __init__(self, key_func, records=()):
+        self.key_func = key_func
+        self.entries = sorted((key_func(r), r["id"]) for r in records)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, record):
+        entry = (self.key_func(record), record["id"])
+        self.entries.insert(bisect_left(self.entries, entry), entry)
+
+    def remove(self, record):
+        entry = (self.key_func(record), record["id"])
+        pos = bisect_left(self.entries, entry)
+        if pos < len(self.entries) and self.entries[pos] == entry:
+            del self.entries[pos]
+
+    def bounds(self, low=None, high=None):
+        # Posições [início, fim) das entradas com low <= chave <= high
+        entries = self.entries
+        start = 0 if low is None else bisect_left(entries, (low,))
+        end = len(entries) if high is None else bisect_right(entries, (high, float("inf")))
+        return start, end
+
+    def iter_range(self, low=None, high=None, after=None, descending=False):
+        # Percorre (chave, id) na ordem pedida, a partir do cursor `after` (exclusivo)
+        start, end = self.bounds(low, high)
+        entries = self.entries
+        if descending:
+            if after is not None:
+                end = min(end, bisect_left(entries, tuple(after)))
+            for pos in range(end - 1, start - 1, -1):
+                yield entries[pos]
+        else:
+            if after is not None:
+                start = max(start, bisect_right(entries, tuple(after)))
+            for pos in range(start, end):
+                yield entries[pos]
+
+    def histogram(self, bins):
+        """(limites, contagens) de `bins` faixas iguais entre a menor e a maior chave.
+
+        Mesmas regras do numpy.histogram: a última faixa inclui o limite superior
+        e, com todas as chaves iguais, o intervalo vira [chave - 0.5, chave + 0.5].
+        Cada contagem sai de uma busca binária: O(bins log n).
+        """
+        entries = self.entries
+        if not entries:
+            return [], []
+        low, high = entries[0][0], entries[-1][0]
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        width = (high - low) / bins
+        edges = [low + width * i for i in range(bins)] + [high]
+        positions = [bisect_left(entries, (edge,)) for edge in edges[1:-1]]
+        positions = [0] + positions + [len(entries)]
+        counts = [positions[i + 1] - positions[i] for i in range(bins)]
+        return edges, counts
+
+
+class CategoryIndex:
+    """categoryId -> ids ordenados dos produtos da categoria."""
+
+    def __init__(self, records=()):
+        self.buckets = {}
+        for record in sorted(records, key=id_key):
+            self.buckets.setdefault(record.get("categoryId"), []).append(record["id"])
+
+    def add(self, record):
+        ids = self.buckets.setdefault(record.get("categoryId"), [])
+        ids.insert(bisect_left(ids, record["id"]), record["id"])
+
+    def remove(self, record):
+        ids = self.buckets.get(record.get("categoryId"))
+        if not ids:
+            return
+        pos = bisect_left(ids, record["id"])
+        if pos < len(ids) and ids[pos] == record["id"]:
+            del ids[pos]
+
+    def ids(self, category_id):
+        return self.buckets.get(category_id, [])
+
+    def iter_ids(self, category_id, after_id=None, descending=False):
+        ids = self.ids(category_id)
+        if descending:
+            end = len(ids) if after_id is None else bisect_left(ids, after_id)
+            for pos in range(end - 1, -1, -1):
+                yield ids[pos], ids[pos]
+        else:
+            start = 0 if after_id is None else bisect_right(ids, after_id)
+            for pos in range(start, len(ids)):
+                yield ids[pos], ids[pos]
+
+
+def quantity_key(product):
+    try:
+        return int(product.get("quantity") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class CategoryStats:
+    """Totais por categoria (produtos, quantidade, soma dos preços), atualizados a cada escrita."""
+
+    def __init__(self, records=()):
+        self.totals = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        totals = self.totals.get(record.get("categoryId"))
+        if totals is None:
+            totals = self.totals[record.get("categoryId")] = [0, 0, 0.0]
+        totals[0] += 1
+        totals[1] += quantity_key(record)
+        totals[2] += price_key(record)
+
+    def remove(self, record):
+        totals = self.totals.get(record.get("categoryId"))
+        if totals is None:
+            return
+        totals[0] -= 1
+        if totals[0] <= 0:
+            # Sem produtos a soma volta a zero exato, sem resíduo de ponto flutuante
+            del self.totals[record.get("categoryId")]
+            return
+        totals[1] -= quantity_key(record)
+        totals[2] -= price_key(record)
+
+    def rows(self):
+        return [
+            {"categoryId": category_id, "count": count, "quantity": quantity, "priceSum": price_sum}
+            for category_id, (count, quantity, price_sum) in self.totals.items()
+        ]
+
+
+_WORD = re.compile(r"\w+")
+
+
+class _AccentTable(dict):
+    # Tabela para str.translate: cada caractere vira sua forma sem acento (calculada uma vez)
+    def __missing__(self, code):
+        decomposed = unicodedata.normalize("NFKD", chr(code))
+        value = self[code] = "".join(c for c in decomposed if not unicodedata.combining(c))
+        return value
+
+
+_ACCENTS = _AccentTable()
+
+
+def fold(text):
+    # Remove acentos e diferença de maiúsculas: "Café" e "CAFE" viram "cafe"
+    text = str(text)
+    if not text.isascii():
+        text = text.translate(_ACCENTS)
+    return text.casefold()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _insort(entries, entry):
+    entries.insert(bisect_left(entries, entry), entry)
+
+
+def _discard(entries, entry):
+    pos = bisect_left(entries, entry)
+    if pos < len(entries) and entries[pos] == entry:
+        del entries[pos]
+
+
+class NameIndex:
+    """Índice para busca por nome, sem acentos e sem diferença de maiúsculas.
+
+    A relevância é a do SQLiteStore (ver `rank`): nome igual, nome começa com a
+    busca, alguma palavra começa com a busca, busca no meio do nome (só com 3+
+    caracteres); em cada faixa, do nome mais curto ao mais longo. Nomes e
+    palavras ficam em listas ordenadas separadas pelo tamanho do nome, então as
+    duas primeiras faixas são lidas do tamanho menor ao maior e a busca para
+    assim que junta `limit` itens; a última usa a menor lista de trigramas da
+    consulta. Exclusões não limpam as listas de trigramas na hora: ids obsoletos
+    são ignorados na consulta e as listas são reconstruídas quando as sobras
+    passam do total de entradas vivas.
+    """
+
+    def __init__(self, records=()):
+        self.folded = {}
+        # tamanho do nome -> [(nome, id)] e [(palavra do nome, id)], ordenadas
+        self.names = {}
+        self.words = {}
+        for record in records:
+            folded = self.folded[record["id"]] = fold(record.get("name", ""))
+            self.names.setdefault(len(folded), []).append((folded, record["id"]))
+            self.words.setdefault(len(folded), []).extend(
+                (word, record["id"]) for word in set(_WORD.findall(folded)))
+        for buckets in (self.names, self.words):
+            for entries in buckets.values():
+                entries.sort()
+        self._rebuild()
+
+    def _rebuild(self):
+        self.postings = {}
+        self.entries = 0
+        self.stale = 0
+        for product_id, folded in self.folded.items():
+            self._post(product_id, folded)
+
+    def _post(self, product_id, folded):
+        grams = trigrams(folded)
+        postings = self.postings
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = [product_id]
+            else:
+                posting.append(product_id)
+        self.entries += len(grams)
+
+    def add(self, record):
+        folded = self.folded[record["id"]] = fold(record.get("name", ""))
+        self._post(record["id"], folded)
+        _insort(self.names.setdefault(len(folded), []), (folded, record["id"]))
+        words = self.words.setdefault(len(folded), [])
+        for word in set(_WORD.findall(folded)):
+            _insort(words, (word, record["id"]))
+
+    def remove(self, record):
+        folded = self.folded.pop(record["id"], None)
+        if folded is None:
+            return
+        _discard(self.names[len(folded)], (folded, record["id"]))
+        words = self.words[len(folded)]
+        for word in set(_WORD.findall(folded)):
+            _discard(words, (word, record["id"]))
+        for buckets in (self.names, self.words):
+            if not buckets[len(folded)]:
+                del buckets[len(folded)]
+        stale = len(trigrams(folded))
+        self.entries -= stale
+        self.stale += stale
+        if self.stale > max(1024, self.entries):
+            self._rebuild()
+
+    def _prefixed(self, buckets, query):
+        # Ids das entradas que começam com a busca, um grupo por tamanho de nome, do menor ao maior
+        for length in sorted(buckets):
+            if length < len(query):
+                continue
+            entries = buckets[length]
+            pos = bisect_left(entries, (query,))
+            group = []
+            while pos < len(entries) and entries[pos][0].startswith(query):
+                group.append(entries[pos][1])
+                pos += 1
+            if group:
+                yield group
+
+    def _contains(self, query):
+        postings = []
+        for gram in trigrams(query):
+            posting = self.postings.get(gram)
+            if not posting:
+                return
+            postings.append(posting)
+        for product_id in min(postings, key=len):
+            name = self.folded.get(product_id)
+            if name is not None and query in name:
+                yield product_id
+
+    def rank(self, product_id, query):
+        """Chave de relevância, a mesma do SQL_SEARCH_RANK do SQLiteStore.
+
+        Faixa (0 nome igual, 1 nome começa com, 2 alguma palavra começa com,
+        3 contém), depois o tamanho do nome, o nome e o id.
+        """
+        name = self.folded[product_id]
+        if name == query:
+            tier = 0
+        elif name.startswith(query):
+            tier = 1
+        elif " " + query in " " + name:
+            tier = 2
+        else:
+            tier = 3
+        return tier, len(name), name, product_id
+
+    def search(self, query, limit=20):
+        """Ids dos produtos cujo nome contém `query`, do mais relevante ao menos."""
+        query = fold(query).strip()
+        if not query:
+            return []
+        # (maior faixa aceita, grupos de candidatos em ordem de relevância entre si)
+        sources = [(1, self._prefixed(self.names, query))]
+        if _WORD.fullmatch(query):
+            # Só uma palavra: toda faixa 2 começa uma palavra do índice
+            sources.append((2, self._prefixed(self.words, query)))
+        if len(query) >= 3:
+            sources.append((3, [self._contains(query)]))
+        elif not _WORD.fullmatch(query):
+            sources.append((2, [self.folded]))
+
+        found = []
+        seen = set()
+        for max_tier, groups in sources:
+            for group in groups:
+                ranked = []
+                for product_id in group:
+                    if product_id not in seen:
+                        key = self.rank(product_id, query)
+                        # Palavra depois de hífen etc. não é faixa 2: fica para a busca por substring
+                        if key[0] <= max_tier:
+                            seen.add(product_id)
+                            ranked.append(key)
+                ranked.sort()
+                found += [key[-1] for key in ranked[:limit - len(found)]]
+                if len(found) >= limit:
+                    return found
+        return found
+        return list(found)
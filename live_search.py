@@ -0,0 +1,59 @@
+import collections
+import threading
+
+from product_filters import product_matcher
+
+# Pesquisa da aba "Pesquisa" do cliente sobre o catálogo local (catalog.py),
+# com os mesmos filtros e a mesma regra de nome de GET /products.
+
+
+class SearchQuery(collections.namedtuple("SearchQuery", "name category_id min_price max_price")):
+    """Filtros da pesquisa; campos vazios são None."""
+
+    def refines(self, other):
+        """Se todo resultado desta consulta também é resultado de `other`."""
+        if other.name and not (self.name and other.name.casefold() in self.name.casefold()):
+            return False
+        if other.category_id is not None and self.category_id != other.category_id:
+            return False
+        if other.min_price is not None and (self.min_price is None or self.min_price < other.min_price):
+            return False
+        if other.max_price is not None and (self.max_price is None or self.max_price > other.max_price):
+            return False
+        return True
+
+    def matcher(self):
+        return product_matcher(self.name, self.category_id, self.min_price, self.max_price)
+
+
+class LiveSearch:
+    """Pesquisa com refinamento incremental.
+
+    Guarda os resultados da última consulta; uma consulta que a refina (mais
+    letras no nome, faixa de preço menor, mesma categoria) filtra só esses
+    resultados em vez do catálogo inteiro. Qualquer alteração no catálogo
+    (`catalog.version`) faz a próxima consulta voltar ao catálogo completo.
+    Os resultados vêm em ordem de nome, como `catalog.sorted_products`.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.last = None
+        self.lock = threading.Lock()
+
+    def run(self, query):
+        with self.lock:
+            last = self.last
+        if last is not None and last[1] == self.catalog.version and query.refines(last[0]):
+            candidates, version = last[2], last[1]
+        else:
+            with self.catalog.lock:
+                candidates, version = list(self.catalog.sorted_products), self.catalog.version
+        results = list(filter(query.matcher(), candidates))
+        with self.lock:
+            self.last = (query, version, results)
+        return results
+
+    def reset(self):
+        with self.lock:
+            self.last = None
@@ -1,28 +1,105 @@
 import flet as ft
+import httpx
 import requests
-import matplotlib
-import matplotlib.pyplot as plt
-from io import BytesIO
 from datetime import datetime
 import base64
 import asyncio
-
-# Configurar o backend do Matplotlib para não usar GUI
-matplotlib.use('Agg')
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from api_client import RETRY_STATUSES, ApiClient, AsyncApiClient, can_resend
+from catalog import Catalog
+from client_cache import ClientCache
+from live_search import LiveSearch, SearchQuery
+from product_list import ProductList
+from charts import (AVG_PRICE_BY_CATEGORY, PRICE_DISTRIBUTION, QUANTITY_BY_CATEGORY, ChartCache,
+                    ProductColumns, render_chart)
 
 # Configurações da API
 API_URL = "http://localhost:3000"
 PRODUCTS_ENDPOINT = f"{API_URL}/products"
 CATEGORIES_ENDPOINT = f"{API_URL}/categories"
+CHANGES_ENDPOINT = f"{API_URL}/changes"
+# Totais para os gráficos, mantidos pelo servidor
+STATS_ENDPOINT = f"{API_URL}/stats"
+# Imprime método, rota, status e tempo de cada requisição à API
+API_LOG_LATENCY = False
+PRICE_HISTOGRAM_BINS = 10
+CHART_FIGSIZE = (10, 6)
+CHART_DPI = 100
+# Memória máxima dos PNGs guardados pelo cache de gráficos
+CHART_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# Processos que renderizam os gráficos (o matplotlib não trava a interface)
+CHART_WORKERS = 2
+# Renderiza os três gráficos em segundo plano a cada carga de dados
+CHART_PRERENDER = True
+CHART_STATS_PATHS = {
+    QUANTITY_BY_CATEGORY: "quantity-by-category",
+    AVG_PRICE_BY_CATEGORY: "avg-price-by-category",
+    PRICE_DISTRIBUTION: f"price-histogram?bins={PRICE_HISTOGRAM_BINS}",
+}
+# Recebe as alterações de outros clientes em tempo real (Server-Sent Events)
+LIVE_SYNC = True
+# Cópia local do catálogo e das escritas feitas sem conexão (None desativa)
+CLIENT_CACHE_PATH = "client_cache.sqlite3"
+# Intervalo entre as tentativas de reenviar as escritas pendentes
+OFFLINE_RETRY_SECONDS = 5
+SEARCH_PAGE_SIZE = 50
+# Espera depois da última tecla antes de pesquisar
+SEARCH_DEBOUNCE_SECONDS = 0.25
+# A lista de produtos cria tiles só para a página visível e vai crescendo com a rolagem
+PRODUCT_PAGE_SIZE = 50
+PRODUCT_LIST_HEIGHT = 400
+# Campos usados na aba de pesquisa (o id é preciso para editar o produto)
+SEARCH_FIELDS = "id,name,price,quantity,categoryId,createdAt"
 
 class ProductApp:
     def __init__(self, page: ft.Page):
         self.page = page
         self.setup_page()
-        self.products = []
-        self.categories = []
-        self.setup_ui()  # Primeiro cria a UI
-        self.load_data()  # Depois carrega os dados
+        # Produtos e categorias com índices por id e por nome (ver catalog.py)
+        self.catalog = Catalog()
+        # Conexões reaproveitadas entre as requisições (ver api_client.py). Os
+        # handlers da interface usam o cliente async e não travam o loop do Flet;
+        # a thread do SSE e os jobs dos gráficos usam o síncrono
+        self.api = ApiClient(log_latency=API_LOG_LATENCY)
+        self.async_api = AsyncApiClient(log_latency=API_LOG_LATENCY)
+        self.http_pool = ThreadPoolExecutor(max_workers=2)
+        # Última resposta de cada GET, reaproveitada quando o servidor responde 304
+        self.http_cache = {}
+        # Posição no feed de alterações do servidor (/changes)
+        self.sync_epoch = None
+        self.sync_seq = None
+        self.sync_lock = threading.Lock()
+        # Versão dos dados locais: muda a cada alteração recebida e invalida os gráficos
+        self.data_version = 0
+        self.data_etags = None
+        self.chart_cache = ChartCache(CHART_CACHE_MAX_BYTES)
+        # Busca dos dados em threads e renderização em processos ("spawn": o
+        # processo do app já tem threads rodando); chart_token identifica o
+        # pedido mais recente da aba de gráficos
+        self.chart_jobs = ThreadPoolExecutor(max_workers=CHART_WORKERS + 1)
+        self.chart_pool = ProcessPoolExecutor(max_workers=CHART_WORKERS,
+                                              mp_context=multiprocessing.get_context("spawn"))
+        self.chart_token = 0
+        self.chart_job = None
+        # (data_version, ProductColumns) para os gráficos sem o servidor
+        self.product_columns = None
+        # Ids provisórios (negativos) do que aparece na tela antes de o servidor confirmar
+        self.temp_ids = itertools.count(-1, -1)
+        # Escritas aguardando conexão, na ordem em que foram feitas (ver write)
+        self.outbox = []
+        self.outbox_keys = itertools.count(1)
+        self.outbox_lock = asyncio.Lock()
+        # O cache local é gravado numa thread só, na ordem das alterações
+        self.cache = ClientCache(CLIENT_CACHE_PATH) if CLIENT_CACHE_PATH else None
+        self.cache_jobs = ThreadPoolExecutor(max_workers=1)
+        self.setup_ui()  # Primeiro cria a UI; os dados vêm depois, em start()
+        if LIVE_SYNC:
+            threading.Thread(target=self.listen_changes, daemon=True).start()
     
     def setup_page(self):
         self.page.title = "Sistema de Gerenciamento de Produtos"
@@ -31,31 +108,236 @@ class ProductApp:
         self.page.window_width = 1000
         self.page.window_height = 700
     
+    async def start(self):
+        # Mostra na hora o catálogo salvo na última execução e depois busca no
+        # servidor só o que mudou desde então; sem cópia local, carga completa
+        if self.restore_cache():
+            self.refresh_views({"products", "categories"})
+            await self.sync_in_background()
+        else:
+            await self.load_data_async()
+        self.refresh_views({"products", "categories"})
+        await self.flush_outbox()
+        self.replay_task = asyncio.create_task(self.replay_writes())
+    
+    def restore_cache(self):
+        """Carrega a cópia local; False se ela não tem catálogo (primeira execução)."""
+        if self.cache is None:
+            return False
+        data = self.cache.load()
+        self.outbox = data["outbox"]
+        if self.outbox:
+            self.outbox_keys = itertools.count(self.outbox[-1]["key"] + 1)
+            lowest = min([entry["id"] for entry in self.outbox] + [0])
+            self.temp_ids = itertools.count(lowest - 1, -1)
+        if data["seq"] is None:
+            return False
+        self.catalog.set_products(data["products"])
+        self.catalog.set_categories(data["categories"])
+        self.sync_epoch = data["epoch"]
+        self.sync_seq = data["seq"]
+        self.apply_outbox()
+        return True
+    
+    def persist(self, method, *args):
+        # Grava no cache local sem esperar (ver ClientCache)
+        if self.cache is not None:
+            self.cache_jobs.submit(getattr(self.cache, method), *args).add_done_callback(self.persist_done)
+    
+    def persist_done(self, future):
+        if future.exception() is not None:
+            print(f"Erro ao gravar o cache local: {future.exception()}")
+    
+    async def sync_in_background(self):
+        # sync_changes usa o cliente síncrono e o sync_lock da thread do SSE
+        try:
+            await asyncio.to_thread(self.sync_changes)
+        except requests.exceptions.RequestException as e:
+            self.load_failed(e)
+    
+    def conditional_headers(self, url):
+        cached = self.http_cache.get(url)
+        return {"If-None-Match": cached[0]} if cached else {}
+    
+    def conditional_get(self, url):
+        """GET com If-None-Match: devolve (status, dados, headers), usando o cache quando nada mudou."""
+        response = self.api.get(url, headers=self.conditional_headers(url))
+        return self.cached_response(url, response)
+    
+    async def conditional_get_async(self, url):
+        response = await self.async_api.get(url, headers=self.conditional_headers(url))
+        return self.cached_response(url, response)
+    
+    def cached_response(self, url, response):
+        cached = self.http_cache.get(url)
+        if response.status_code == 304 and cached:
+            return 200, cached[1], response.headers
+        if response.status_code != 200:
+            return response.status_code, None, response.headers
+        payload = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self.http_cache[url] = (etag, payload)
+        return 200, payload, response.headers
+    
     def load_data(self):
         try:
-        # Carrega produtos e categorias
-            products_response = requests.get(PRODUCTS_ENDPOINT)
-            categories_response = requests.get(CATEGORIES_ENDPOINT)
+        # Carrega produtos e categorias ao mesmo tempo
+            products_request = self.http_pool.submit(self.conditional_get, PRODUCTS_ENDPOINT)
+            categories_result = self.conditional_get(CATEGORIES_ENDPOINT)
+            self.set_loaded_data(products_request.result(), categories_result)
+        except requests.exceptions.RequestException as e:
+            self.load_failed(e)
+    
+    async def load_data_async(self):
+        try:
+            products_result, categories_result = await asyncio.gather(
+                self.conditional_get_async(PRODUCTS_ENDPOINT),
+                self.conditional_get_async(CATEGORIES_ENDPOINT)
+            )
+            self.set_loaded_data(products_result, categories_result)
+        except httpx.HTTPError as e:
+            self.load_failed(e)
+    
+    def set_loaded_data(self, products_result, categories_result):
+        products_status, products, products_headers = products_result
+        categories_status, categories, categories_headers = categories_result
         
-            if products_response.status_code == 200:
-                self.products = products_response.json()
-            else:
-                self.products = []
-                print(f"Erro ao carregar produtos: {products_response.status_code}")
+        # Uma lista que falhou não apaga a que já está na tela (inclusive a do cache local)
+        errors = []
+        if products_status == 200:
+            self.catalog.set_products(products)
+        else:
+            errors.append(f"produtos ({products_status})")
+        
+        if categories_status == 200:
+            self.catalog.set_categories(categories)
+            # Atualiza ambos dropdowns quando os dados são carregados
+            self.update_search_category_dropdown()
+        else:
+            errors.append(f"categorias ({categories_status})")
+        
+        if errors:
+            self.show_snackbar(f"Erro ao carregar {' e '.join(errors)}")
         
-            if categories_response.status_code == 200:
-                self.categories = categories_response.json()
-                # Atualiza ambos dropdowns quando os dados são carregados
-                self.update_search_category_dropdown()
+        if products_status == 200 and categories_status == 200:
+            # 304 nas duas listas: os gráficos já renderizados continuam valendo
+            etags = (products_headers.get("ETag"), categories_headers.get("ETag"))
+            if None in etags or etags != self.data_etags:
+                self.data_etags = etags
+                self.invalidate_charts()
+        
+        # Sincroniza a partir da posição mais antiga entre as duas leituras
+        # (reaplicar uma alteração já vista não tem efeito)
+        if products_status == 200 and categories_status == 200:
+            seqs = [int(h["X-Change-Seq"]) for h in (products_headers, categories_headers)
+                    if "X-Change-Seq" in h]
+            if seqs:
+                self.sync_epoch = products_headers.get("X-Store-Epoch")
+                self.sync_seq = min(seqs)
+                self.persist("replace", products, categories, self.sync_epoch, self.sync_seq)
+        
+        # O servidor ainda não recebeu as escritas da fila: elas continuam na tela
+        self.apply_outbox()
+    
+    def load_failed(self, error):
+        # O catálogo já mostrado (inclusive o do cache local) continua na tela
+        print(f"Erro de conexão: {error}")
+        self.show_snackbar("Erro ao conectar com o servidor!")
+    
+    def apply_changes(self, changes):
+        """Aplica as alterações do feed às coleções locais; devolve as coleções afetadas."""
+        touched = set()
+        for change in changes:
+            if change["collection"] == "products":
+                # Só o tile do produto muda (ver refresh_views com patched=True)
+                if change["op"] == "put":
+                    self.show_product(change["record"])
+                else:
+                    self.hide_product(change["id"])
+            elif change["op"] == "put":
+                self.catalog.put_category(change["record"])
             else:
-                self.categories = []
-                print(f"Erro ao carregar categorias: {categories_response.status_code}")
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Erro de conexão: {e}")
-            self.products = []
-            self.categories = []
-            self.show_snackbar("Erro ao conectar com o servidor!")
+                self.catalog.remove_category(change["id"])
+            touched.add(change["collection"])
+            self.sync_seq = change["seq"]
+        if touched:
+            self.persist("apply", changes, self.sync_epoch, self.sync_seq)
+            self.invalidate_charts()
+        return touched
+    
+    def invalidate_charts(self):
+        self.data_version += 1
+        self.chart_cache.clear()
+        self.prerender_charts()
+    
+    def refresh_views(self, touched, patched=False):
+        """Atualiza a interface; com `patched` a lista de produtos já recebeu cada alteração."""
+        if "categories" in touched:
+            self.update_category_dropdown()
+            self.update_search_category_dropdown()
+        if not touched:
+            return
+        if not patched:
+            self.update_products_list()
+            return
+        if "categories" in touched:
+            self.product_list.refresh()
+        self.page.update()
+    
+    def sync_changes(self):
+        # Busca só o que mudou desde a última sincronização
+        with self.sync_lock:
+            if self.sync_seq is None:
+                self.load_data()
+                self.refresh_views({"products", "categories"})
+                return
+            response = self.api.get(
+                CHANGES_ENDPOINT, 
+                params={"since": self.sync_seq, "epoch": self.sync_epoch}
+            )
+            if response.status_code != 200:
+                print(f"Erro ao sincronizar: {response.status_code}")
+                return
+            feed = response.json()
+            if feed["reset"]:
+                self.load_data()
+                self.refresh_views({"products", "categories"})
+                return
+            touched = self.apply_changes(feed["changes"])
+            self.sync_seq = feed["version"]
+            self.refresh_views(touched, patched=True)
+    
+    def listen_changes(self):
+        # Thread em segundo plano: recebe as alterações de todos os clientes via SSE
+        while True:
+            try:
+                if self.sync_seq is None:
+                    # Ainda sem carga inicial bem-sucedida
+                    time.sleep(5)
+                    continue
+                params = {"since": self.sync_seq, "epoch": self.sync_epoch}
+                with self.api.get(f"{CHANGES_ENDPOINT}/stream", params=params, stream=True,
+                                  timeout=(5, 60)) as response:
+                    event = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            payload = json.loads(line[5:])
+                            with self.sync_lock:
+                                if event == "reset":
+                                    self.load_data()
+                                    touched = {"products", "categories"}
+                                else:
+                                    touched = self.apply_changes([payload])
+                                self.refresh_views(touched, patched=event != "reset")
+                            if event == "reset":
+                                break
+                        elif not line:
+                            event = None
+            except requests.exceptions.RequestException:
+                time.sleep(5)
     
     def setup_ui(self):
         self.current_tab_index = 0
@@ -99,7 +381,7 @@ class ProductApp:
     def update_search_category_dropdown(self):
         if hasattr(self, 'search_category'):
             self.search_category.options = [ft.dropdown.Option("Todas")] + [
-                ft.dropdown.Option(cat["name"]) for cat in self.categories
+                ft.dropdown.Option(cat["name"]) for cat in self.catalog.category_list()
             ]
             self.page.update()
 
@@ -167,7 +449,15 @@ class ProductApp:
         )
         
         # Lista de produtos
-        self.products_list = ft.ListView(expand=True)
+        self.product_list = ProductList(
+            PRODUCT_PAGE_SIZE,
+            "Nenhum produto cadastrado.",
+            self.catalog,
+            on_edit=self.edit_product,
+            on_delete=self.delete_product,
+            height=PRODUCT_LIST_HEIGHT
+        )
+        self.products_list = self.product_list.view
         
         # Atualiza os controles
         self.update_category_dropdown()
@@ -196,91 +486,45 @@ class ProductApp:
         self.category_dropdown.visible = not self.new_category_field.visible
         self.page.update()
     
-    def save_category(self, e):
+    async def save_category(self, e):
         category_name = self.new_category_field.value.strip()
     
         if not category_name:
             self.show_snackbar("Nome da categoria é obrigatório!")
             return
         
-        if any(cat["name"].lower() == category_name.lower() for cat in self.categories):
+        if self.catalog.has_category_name(category_name):
             self.show_snackbar("Esta categoria já existe!")
             return
         
-        try:
-            response = requests.post(
-                CATEGORIES_ENDPOINT, 
-                json={"name": category_name}
-            )
-        
-            if response.status_code == 201:
-                new_category = response.json()
-                self.categories.append(new_category)
-                self.show_snackbar("Categoria cadastrada com sucesso!")
-                self.update_category_dropdown()
-                self.update_search_category_dropdown()
-                self.new_category_field.value = ""
-                self.toggle_new_category_field(None)
-                self.load_data()  # Recarrega os dados para garantir sincronização
-            else:
-                self.show_snackbar(f"Erro ao cadastrar categoria: {response.text}")
-            
-        except requests.exceptions.RequestException:
-            self.show_snackbar("Erro de conexão com a API!")
+        self.new_category_field.value = ""
+        self.toggle_new_category_field(None)
+        category_id = next(self.temp_ids)
+        saved = await self.write({
+            "method": "POST",
+            "path": "/categories",
+            "body": {"name": category_name},
+            "collection": "categories",
+            "id": category_id,
+            "record": {"id": category_id, "name": category_name},
+            "previous": None,
+            "done": "Categoria cadastrada com sucesso!",
+            "failed": "Erro ao cadastrar categoria",
+        })
+        if saved:
+            await self.sync_in_background()  # Busca só as alterações para garantir sincronização
     
     def update_category_dropdown(self):
         options = [ft.dropdown.Option("Selecione uma categoria")]
-        options.extend(ft.dropdown.Option(cat["name"]) for cat in self.categories)
+        options.extend(ft.dropdown.Option(cat["name"]) for cat in self.catalog.category_list())
         self.category_dropdown.options = options
         self.page.update()
     
     def update_products_list(self):
-        self.products_list.controls.clear()
-        
-        if not self.products:
-            self.products_list.controls.append(
-                ft.ListTile(title=ft.Text("Nenhum produto cadastrado.")))
-            self.page.update()
-            return
-            
-        for product in sorted(self.products, key=lambda x: x['name']):
-            category_name = next(
-                (cat["name"] for cat in self.categories if cat["id"] == product.get("categoryId")), 
-                "Sem categoria"
-            )
-            
-            created_at = datetime.fromisoformat(product["createdAt"]).strftime("%d/%m/%Y %H:%M") 
-            
-            product_item = ft.ListTile(
-                title=ft.Text(product["name"]),
-                subtitle=ft.Text(
-                    f"Preço: R${product['price']:.2f} | "
-                    f"Quantidade: {product['quantity']} | "
-                    f"Categoria: {category_name}\n"
-                    f"Cadastrado em: {created_at}"
-                ),
-                trailing=ft.Row(
-                    controls=[
-                        ft.IconButton(
-                            icon="EDIT",
-                            tooltip="Editar",
-                            on_click=lambda e, p=product: self.edit_product(p),
-                        ),
-                        ft.IconButton(
-                            icon="DELETE",
-                            tooltip="Excluir",
-                            on_click=lambda e, p=product: self.delete_product(p),
-                            icon_color="red"
-                        ),
-                    ],
-                    width=100,
-                ),
-            )
-            self.products_list.controls.append(product_item)
-        
+        self.product_list.set_items(self.catalog.sorted_products)
         self.page.update()
     
-    def save_product(self, e):
+    async def save_product(self, e):
         # Validação dos campos
         name = self.name_field.value.strip()
         price = self.price_field.value.strip()
@@ -303,10 +547,10 @@ class ProductApp:
             self.show_snackbar("Selecione uma categoria!")
             return
             
-        category_id = next(
-            (cat["id"] for cat in self.categories if cat["name"] == category_name), 
-            None
-        )
+        category_id = self.catalog.category_ids.get(category_name)
+        if category_id is not None and category_id < 0:
+            self.show_snackbar("Aguarde a categoria ser salva no servidor!")
+            return
         
         # Prepara o novo produto
         new_product = {
@@ -317,68 +561,188 @@ class ProductApp:
             "createdAt": datetime.now().isoformat(),
         }
         
+        # O formulário é limpo já (evita salvar duas vezes)
+        product_id = getattr(self, 'editing_product_id', None)
+        self.clear_form()
+        if product_id is None:
+            product_id = next(self.temp_ids)
+            entry = {
+                "method": "POST",
+                "path": "/products",
+                "record": dict(new_product, id=product_id),
+                "previous": None,
+                "done": "Produto cadastrado com sucesso!",
+                "failed": "Erro ao cadastrar produto",
+            }
+        else:
+            previous = self.catalog.products.get(product_id)
+            entry = {
+                "method": "PUT",
+                "path": f"/products/{product_id}",
+                "record": dict(previous or {}, **new_product, id=product_id),
+                "previous": previous,
+                "done": "Produto atualizado com sucesso!",
+                "failed": "Erro ao atualizar produto",
+            }
+        entry.update(body=new_product, collection="products", id=product_id)
+        if await self.write(entry):
+            await self.sync_in_background()
+    
+    def show_product(self, product):
+        # Coloca (ou substitui) o produto no catálogo e só no tile afetado
+        with self.catalog.lock:
+            old_pos, new_pos = self.catalog.put_product(product)
+            self.product_list.patch(old_pos, new_pos, product)
+    
+    def hide_product(self, product_id):
+        with self.catalog.lock:
+            pos = self.catalog.remove_product(product_id)
+            if pos is not None:
+                self.product_list.patch(pos, None)
+    
+    async def write(self, entry):
+        """Mostra a escrita na hora e envia ao servidor; True se ele confirmou.
+        
+        `entry` descreve a requisição (method, path, body) e o efeito local:
+        o registro da coleção com esse id passa a ser `record` (None remove) e
+        volta a ser `previous` se o servidor recusar. Sem conexão, a escrita
+        fica na fila, gravada no cache local, e é reenviada depois, na ordem.
+        """
+        entry["key"] = next(self.outbox_keys)
+        self.apply_write(entry)
+        self.page.update()
+        if self.outbox:
+            # Há escritas anteriores esperando: esta vai para o fim da fila
+            self.enqueue_write(entry)
+            return False
+        return await self.send_write(entry) is True
+    
+    async def send_write(self, entry, queued=False):
+        """Envia `entry`: True se confirmada, False se recusada (já desfeita), None se ficou na fila."""
         try:
-            if hasattr(self, 'editing_product_id'):
-                # Atualização de produto existente
-                response = requests.put(
-                    f"{PRODUCTS_ENDPOINT}/{self.editing_product_id}", 
-                    json=new_product
-                )
-                if response.status_code == 200:
-                    self.show_snackbar("Produto atualizado com sucesso!")
-                    del self.editing_product_id
-                else:
-                    self.show_snackbar(f"Erro ao atualizar produto: {response.text}")
-            else:
-                # Cadastro de novo produto
-                response = requests.post(PRODUCTS_ENDPOINT, json=new_product)
-                if response.status_code == 201:
-                    self.show_snackbar("Produto cadastrado com sucesso!")
-            
-            self.load_data()
-            self.clear_form()
-            self.update_products_list()
-            
-        except requests.exceptions.RequestException:
+            response = await self.async_api.request(
+                entry["method"], f"{API_URL}{entry['path']}", json=entry["body"]
+            )
+        except httpx.HTTPError as e:
+            if can_resend(entry["method"], e):
+                if not queued:
+                    self.enqueue_write(entry)
+                return None
+            self.undo_write(entry)
             self.show_snackbar("Erro de conexão com a API!")
+            return False
+        if response.status_code in RETRY_STATUSES:
+            # Servidor fora do ar atrás do proxy: tenta de novo mais tarde
+            if not queued:
+                self.enqueue_write(entry)
+            return None
+        if not response.is_success:
+            self.undo_write(entry)
+            self.show_snackbar(f"{entry['failed']}: {response.text}")
+            return False
+        self.confirm_write(entry, response)
+        self.show_snackbar(entry["done"])
+        return True
+    
+    def enqueue_write(self, entry):
+        self.outbox.append(entry)
+        self.persist("enqueue", entry)
+        self.show_snackbar("Sem conexão: a alteração será enviada quando o servidor voltar.")
+    
+    async def flush_outbox(self):
+        # Reenvia a fila na ordem; para na primeira escrita que ainda não passou
+        sent = False
+        async with self.outbox_lock:
+            while self.outbox:
+                entry = self.outbox[0]
+                if await self.send_write(entry, queued=True) is None:
+                    break
+                self.outbox.pop(0)
+                self.persist("dequeue", entry["key"])
+                sent = True
+        if sent:
+            await self.sync_in_background()
+    
+    async def replay_writes(self):
+        while True:
+            await asyncio.sleep(OFFLINE_RETRY_SECONDS)
+            if self.outbox:
+                await self.flush_outbox()
+    
+    def apply_outbox(self):
+        for entry in self.outbox:
+            self.apply_write(entry)
+    
+    def apply_write(self, entry):
+        self.set_record(entry["collection"], entry["id"], entry["record"])
+    
+    def undo_write(self, entry):
+        self.set_record(entry["collection"], entry["id"], entry["previous"])
+    
+    def confirm_write(self, entry, response):
+        # O registro devolvido pelo servidor substitui o otimista (e o id provisório)
+        if entry["record"] is None:
+            return
+        record = response.json()
+        if record["id"] != entry["id"]:
+            self.set_record(entry["collection"], entry["id"], None)
+        self.set_record(entry["collection"], record["id"], record)
+    
+    def set_record(self, collection, record_id, record):
+        if collection == "products":
+            if record is None:
+                self.hide_product(record_id)
+            else:
+                self.show_product(record)
+            return
+        if record is None:
+            self.catalog.remove_category(record_id)
+        else:
+            self.catalog.put_category(record)
+        self.update_category_dropdown()
+        self.update_search_category_dropdown()
     
     def edit_product(self, product):
+        if product["id"] < 0:
+            self.show_snackbar("Aguarde o produto ser salvo no servidor!")
+            return
         self.name_field.value = product["name"]
         self.price_field.value = str(product["price"])
         self.quantity_field.value = str(product["quantity"])
         
-        category_name = next(
-            (cat["name"] for cat in self.categories if cat["id"] == product.get("categoryId")), 
-            ""
-        )
+        category_name = self.catalog.category_names.get(product.get("categoryId"), "")
         self.category_dropdown.value = category_name
         
         self.save_button.text = "Atualizar"
         self.editing_product_id = product["id"]
         self.page.update()
     
-    def delete_product(self, product):
-        try:
-            response = requests.delete(f"{PRODUCTS_ENDPOINT}/{product['id']}")
-            if response.status_code == 200:
-                self.show_snackbar("Produto excluído com sucesso!")
-                self.products = [p for p in self.products if p['id'] != product['id']]
-                self.update_products_list()
-            else:
-                self.show_snackbar(f"Erro ao excluir produto: {response.text}")
-        except requests.exceptions.RequestException as e:
-            self.show_snackbar(f"Erro de conexão: {str(e)}")
+    async def delete_product(self, product):
+        if product['id'] < 0:
+            self.show_snackbar("Aguarde o produto ser salvo no servidor!")
+            return
+        saved = await self.write({
+            "method": "DELETE",
+            "path": f"/products/{product['id']}",
+            "body": None,
+            "collection": "products",
+            "id": product['id'],
+            "record": None,
+            "previous": product,
+            "done": "Produto excluído com sucesso!",
+            "failed": "Erro ao excluir produto",
+        })
+        if saved:
+            self.invalidate_charts()
     
     def create_charts_tab(self):
         self.chart_type_dropdown = ft.Dropdown(
             label="Tipo de Gráfico",
-            options=[
-                ft.dropdown.Option("Quantidade por Categoria"),
-                ft.dropdown.Option("Preço Médio por Categoria"),
-                ft.dropdown.Option("Distribuição de Preços"),
-            ],
-            value="Quantidade por Categoria",
-            width=300
+            options=[ft.dropdown.Option(chart_type) for chart_type in CHART_STATS_PATHS],
+            value=QUANTITY_BY_CATEGORY,
+            width=300,
+            # Trocar o tipo já gera o gráfico (e torna obsoleto o que estava renderizando)
+            on_change=self.generate_chart
         )
         
         self.generate_button = ft.ElevatedButton(
@@ -393,11 +757,13 @@ class ProductApp:
             fit=ft.ImageFit.CONTAIN
         )
         
+        self.chart_loading = ft.ProgressRing(visible=False)
+        
         return ft.Column(
             controls=[
                 ft.Text("Gráficos de Produtos", size=24, weight=ft.FontWeight.BOLD),
                 ft.Row(
-                    [self.chart_type_dropdown, self.generate_button],
+                    [self.chart_type_dropdown, self.generate_button, self.chart_loading],
                     alignment=ft.MainAxisAlignment.CENTER
                 ),
                 ft.Divider(height=1),
@@ -413,134 +779,121 @@ class ProductApp:
     
     def generate_chart(self, e):
         chart_type = self.chart_type_dropdown.value
-        
-        if chart_type == "Quantidade por Categoria":
-            self.generate_quantity_by_category_chart()
-        elif chart_type == "Preço Médio por Categoria":
-            self.generate_avg_price_by_category_chart()
-        elif chart_type == "Distribuição de Preços":
-            self.generate_price_distribution_chart()
+        if chart_type not in CHART_STATS_PATHS:
+            return
+        # Mesmo tipo, mesmos dados e mesmo tamanho: reaproveita o PNG já renderizado
+        key = self.chart_key(chart_type)
+        png = self.chart_cache.get(key)
+        if png is not None:
+            self.chart_token += 1
+            self.chart_loading.visible = False
+            self.display_chart(png)
+            return
+        # Renderiza fora da thread do evento; um pedido novo torna o anterior obsoleto
+        self.chart_token += 1
+        token = self.chart_token
+        if self.chart_job is not None:
+            self.chart_job.cancel()
+        self.chart_loading.visible = True
+        self.page.update()
+        self.chart_job = self.chart_jobs.submit(self.show_rendered_chart, chart_type, key, token)
     
-    def generate_quantity_by_category_chart(self):
-        category_quantities = {}
-        
-        for product in self.products:
-            category_name = next(
-                (cat["name"] for cat in self.categories if cat["id"] == product.get("categoryId")), 
-                "Sem categoria"
-            )
-            
-            if category_name not in category_quantities:
-                category_quantities[category_name] = 0
-            category_quantities[category_name] += product["quantity"]
-        
-        # Ordena por quantidade
-        sorted_categories = sorted(category_quantities.items(), key=lambda x: x[1], reverse=True)
-        categories = [x[0] for x in sorted_categories]
-        quantities = [x[1] for x in sorted_categories]
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        bars = ax.barh(categories, quantities, color='skyblue')
-        
-        # Adiciona os valores nas barras
-        for bar in bars:
-            width = bar.get_width()
-            ax.text(width + 0.3, bar.get_y() + bar.get_height()/2, 
-                    f'{int(width)}', 
-                    va='center', ha='left')
-        
-        ax.set_title("Quantidade de Produtos por Categoria", pad=20)
-        ax.set_xlabel("Quantidade Total")
-        ax.set_ylabel("Categoria")
-        plt.tight_layout()
-        
-        self.display_chart(fig)
-    
-    def generate_avg_price_by_category_chart(self):
-        category_prices = {}
-        
-        for product in self.products:
-            category_name = next(
-                (cat["name"] for cat in self.categories if cat["id"] == product.get("categoryId")), 
-                "Sem categoria"
-            )
-            
-            if category_name not in category_prices:
-                category_prices[category_name] = []
-            category_prices[category_name].append(product["price"])
-        
-        # Calcula a média e ordena
-        category_avg = {k: sum(v)/len(v) for k, v in category_prices.items()}
-        sorted_categories = sorted(category_avg.items(), key=lambda x: x[1], reverse=True)
-        categories = [x[0] for x in sorted_categories]
-        averages = [x[1] for x in sorted_categories]
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        bars = ax.barh(categories, averages, color='lightgreen')
-        
-        # Adiciona os valores nas barras
-        for bar in bars:
-            width = bar.get_width()
-            ax.text(width + 0.3, bar.get_y() + bar.get_height()/2, 
-                    f'R${width:.2f}', 
-                    va='center', ha='left')
-        
-        ax.set_title("Preço Médio por Categoria", pad=20)
-        ax.set_xlabel("Preço Médio (R$)")
-        ax.set_ylabel("Categoria")
-        plt.tight_layout()
-        
-        self.display_chart(fig)
-    
-    def generate_price_distribution_chart(self):
-        prices = [p["price"] for p in self.products]
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.hist(prices, bins=10, color='orange', edgecolor='black')
-        
-        ax.set_title("Distribuição de Preços dos Produtos", pad=20)
-        ax.set_xlabel("Preço (R$)")
-        ax.set_ylabel("Quantidade de Produtos")
-        plt.tight_layout()
-        
-        self.display_chart(fig)
-    
-    def display_chart(self, fig):
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches='tight', dpi=100)
-        buf.seek(0)
-        self.chart_image.src_base64 = base64.b64encode(buf.read()).decode("utf-8")
-        plt.close(fig)
+    def chart_key(self, chart_type):
+        return (chart_type, self.data_version, CHART_FIGSIZE, CHART_DPI)
+    
+    def show_rendered_chart(self, chart_type, key, token):
+        png = self.render_chart(chart_type, key, token)
+        if token != self.chart_token:
+            # O usuário já pediu outro gráfico; o PNG fica no cache
+            return
+        self.chart_loading.visible = False
+        if png is None:
+            self.page.update()
+            return
+        self.display_chart(png)
+    
+    def render_chart(self, chart_type, key, token=None):
+        """Busca os dados e renderiza no pool de processos; None se o pedido ficou obsoleto ou falhou."""
+        png = self.chart_cache.get(key)
+        if png is not None:
+            return png
+        if key[1] != self.data_version or (token is not None and token != self.chart_token):
+            return None
+        data = self.fetch_stats(CHART_STATS_PATHS[chart_type])
+        if data is None:
+            data = self.local_chart_data(chart_type, key[1])
+        if data is None or key[1] != self.data_version:
+            return None
+        png = self.chart_pool.submit(render_chart, chart_type, data, CHART_FIGSIZE, CHART_DPI).result()
+        self.chart_cache.put(key, png)
+        return png
+    
+    def prerender_charts(self):
+        # Deixa os três gráficos prontos no cache para a versão atual dos dados
+        if not CHART_PRERENDER:
+            return
+        for chart_type in CHART_STATS_PATHS:
+            self.chart_jobs.submit(self.render_chart, chart_type, self.chart_key(chart_type))
+    
+    def fetch_stats(self, path):
+        """Estatísticas calculadas pelo servidor (/stats/...); None se a requisição falhar."""
+        try:
+            status, payload, _ = self.conditional_get(f"{STATS_ENDPOINT}/{path}")
+        except requests.exceptions.RequestException as e:
+            print(f"Erro de conexão: {e}")
+            return None
+        if status != 200:
+            print(f"Erro ao carregar estatísticas: {status}")
+            return None
+        return payload
+    
+    def local_chart_data(self, chart_type, version):
+        # Sem /stats, agrega os produtos já carregados em colunas NumPy
+        # (montadas uma vez por versão dos dados)
+        columns = self.product_columns
+        if columns is None or columns[0] != version:
+            if version != self.data_version:
+                return None
+            columns = self.product_columns = (version, ProductColumns(self.catalog.product_snapshot()))
+        return columns[1].chart_data(chart_type, self.catalog.category_names, PRICE_HISTOGRAM_BINS)
+    
+    def display_chart(self, png):
+        self.chart_image.src_base64 = base64.b64encode(png).decode("utf-8")
         self.page.update()
     
     def create_search_tab(self):
+        # A pesquisa roda enquanto o usuário digita (ver search_changed)
         self.search_name = ft.TextField(
             label="Nome do Produto", 
             width=300,
-            hint_text="Digite parte do nome"
+            hint_text="Digite parte do nome",
+            on_change=self.search_changed
         )
     
         self.search_category = ft.Dropdown(
             label="Categoria",
             width=300,
             options=[ft.dropdown.Option("Todas")] + [
-                ft.dropdown.Option(cat["name"]) for cat in self.categories
+                ft.dropdown.Option(cat["name"]) for cat in self.catalog.category_list()
             ],
-            value="Todas"
+            value="Todas",
+            on_change=self.search_changed
         )
         
         self.search_price_min = ft.TextField(
             label="Preço Mínimo", 
             width=150,
             input_filter=ft.NumbersOnlyInputFilter(),
-            prefix_text="R$ "
+            prefix_text="R$ ",
+            on_change=self.search_changed
         )
         
         self.search_price_max = ft.TextField(
             label="Preço Máximo", 
             width=150,
             input_filter=ft.NumbersOnlyInputFilter(),
-            prefix_text="R$ "
+            prefix_text="R$ ",
+            on_change=self.search_changed
         )
         
         self.search_button = ft.ElevatedButton(
@@ -556,11 +909,31 @@ class ProductApp:
             color="red"
         )
         
-        self.search_results = ft.ListView(
-            expand=True,
+        # Ao chegar no fim da lista, busca a próxima página do servidor
+        self.search_list = ProductList(
+            SEARCH_PAGE_SIZE,
+            "Nenhum produto encontrado.",
+            self.catalog,
+            on_click=self.edit_product,
+            on_end=lambda: self.page.run_task(self.load_more_results, None),
+            height=PRODUCT_LIST_HEIGHT,
             spacing=10,
             padding=10
         )
+        self.search_results = self.search_list.view
+        
+        self.search_params = {}
+        self.search_cursor = None
+        # Pesquisa em andamento (espera da digitação ou consulta); a próxima a cancela
+        self.search_task = None
+        self.live_search = LiveSearch(self.catalog)
+        # Evita buscar a mesma página duas vezes (botão e rolagem ao mesmo tempo)
+        self.search_fetch_lock = threading.Lock()
+        self.load_more_button = ft.TextButton(
+            "Carregar mais",
+            on_click=self.load_more_results,
+            visible=False
+        )
         
         return ft.Column(
             controls=[
@@ -574,14 +947,27 @@ class ProductApp:
                     ], alignment=ft.MainAxisAlignment.END)
                 ]),
                 ft.Divider(height=1),
-                self.search_results
+                self.search_results,
+                self.load_more_button
             ],
             scroll=ft.ScrollMode.AUTO,
             expand=True
         )
     
-    def search_products(self, e):
-        name_filter = self.search_name.value.lower() if self.search_name.value else None
+    async def search_changed(self, e):
+        self.schedule_search(SEARCH_DEBOUNCE_SECONDS)
+    
+    async def search_products(self, e):
+        self.schedule_search(0)
+    
+    def schedule_search(self, delay):
+        # Cada tecla adia a pesquisa e cancela a anterior, ainda esperando ou já consultando
+        if self.search_task is not None:
+            self.search_task.cancel()
+        self.search_task = asyncio.create_task(self.run_search(delay))
+    
+    def search_query(self):
+        name_filter = self.search_name.value.strip() if self.search_name.value else None
         category_filter = self.search_category.value if self.search_category.value != "Todas" else None
         
         try:
@@ -589,61 +975,90 @@ class ProductApp:
             price_max = float(self.search_price_max.value) if self.search_price_max.value else None
         except ValueError:
             self.show_snackbar("Preços devem ser números válidos!")
+            return None
+        
+        category_id = self.catalog.category_ids.get(category_filter) if category_filter else None
+        return SearchQuery(name_filter or None, category_id, price_min, price_max)
+    
+    async def run_search(self, delay):
+        await asyncio.sleep(delay)
+        query = self.search_query()
+        if query is None:
+            return
+        if self.sync_seq is not None:
+            # Catálogo local carregado (do servidor ou do cache): filtra aqui,
+            # fora do loop, e mostra uma página por vez
+            results = await asyncio.to_thread(self.live_search.run, query)
+            self.search_cursor = None
+            self.search_list.set_items(results, reset_window=True)
+            self.load_more_button.visible = self.search_list.has_more()
+            self.page.update()
             return
-
-        filtered_products = self.products
         
-        if name_filter:
-            filtered_products = [p for p in filtered_products if name_filter in p["name"].lower()]
+        # Sem catálogo local: filtros aplicados no servidor, com paginação por cursor
+        params = {"sort": "name", "limit": SEARCH_PAGE_SIZE, "fields": SEARCH_FIELDS}
+        if query.name:
+            params["name"] = query.name
+        if query.category_id:
+            params["categoryId"] = query.category_id
+        if query.min_price is not None:
+            params["minPrice"] = query.min_price
+        if query.max_price is not None:
+            params["maxPrice"] = query.max_price
         
-        if category_filter:
-            category_id = next(
-                (cat["id"] for cat in self.categories if cat["name"] == category_filter), 
-                None
-            )
-            if category_id:
-                filtered_products = [p for p in filtered_products if p.get("categoryId") == category_id]
+        self.search_params = params
+        self.search_cursor = None
+        await self.fetch_search_page()
+    
+    async def load_more_results(self, e):
+        if not self.search_fetch_lock.acquire(blocking=False):
+            return
+        try:
+            if self.search_cursor:
+                await self.fetch_search_page(self.search_cursor)
+            elif self.search_list.show_more():
+                # Resultados locais: a próxima página já está em memória
+                self.load_more_button.visible = self.search_list.has_more()
+                self.page.update()
+        finally:
+            self.search_fetch_lock.release()
+    
+    async def fetch_search_page(self, cursor=None):
+        params = dict(self.search_params)
+        if cursor:
+            params["cursor"] = cursor
         
-        if price_min is not None:
-            filtered_products = [p for p in filtered_products if p["price"] >= price_min]
+        try:
+            response = await self.async_api.get(PRODUCTS_ENDPOINT, params=params)
+        except httpx.HTTPError:
+            self.show_snackbar("Erro de conexão com a API!")
+            return
         
-        if price_max is not None:
-            filtered_products = [p for p in filtered_products if p["price"] <= price_max]
+        if response.status_code != 200:
+            self.show_snackbar(f"Erro na pesquisa: {response.text}")
+            return
         
-        self.search_results.controls.clear()
+        filtered_products = response.json()
+        self.search_cursor = response.headers.get("X-Next-Cursor")
+        self.load_more_button.visible = bool(self.search_cursor)
         
-        if not filtered_products:
-            self.search_results.controls.append(
-                ft.ListTile(title=ft.Text("Nenhum produto encontrado.")))
+        if cursor:
+            self.search_list.extend(filtered_products)
         else:
-            for product in filtered_products:
-                category_name = next(
-                    (cat["name"] for cat in self.categories if cat["id"] == product.get("categoryId")), 
-                    "Sem categoria"
-                )
-                
-                created_at = datetime.fromisoformat(product["createdAt"]).strftime("%d/%m/%Y %H:%M") 
-                
-                product_item = ft.ListTile(
-                    title=ft.Text(product["name"]),
-                    subtitle=ft.Text(
-                        f"Preço: R${product['price']:.2f} | "
-                        f"Quantidade: {product['quantity']} | "
-                        f"Categoria: {category_name}\n"
-                        f"Cadastrado em: {created_at}"
-                    ),
-                    on_click=lambda e, p=product: self.edit_product(p),
-                )
-                self.search_results.controls.append(product_item)
+            self.search_list.set_items(filtered_products, reset_window=True)
         
         self.page.update()
     
-    def clear_search(self, e):
+    async def clear_search(self, e):
+        if self.search_task is not None:
+            self.search_task.cancel()
         self.search_name.value = ""
         self.search_category.value = "Todas"
         self.search_price_min.value = ""
         self.search_price_max.value = ""
-        self.search_results.controls.clear()
+        self.search_list.clear()
+        self.search_cursor = None
+        self.load_more_button.visible = False
         self.page.update()
     
     def clear_form(self):
@@ -666,13 +1081,14 @@ class ProductApp:
         self.page.snack_bar.open = True
         self.page.update()
 
-def main(page: ft.Page):
+async def main(page: ft.Page):
     # Configuração especial para Windows
     if hasattr(asyncio, 'WindowsSelectorEventLoopPolicy'):
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     
     # Cria e inicia a aplicação
     app = ProductApp(page)
+    await app.start()
 
 if __name__ == "__main__":
     ft.app(target=main)
\ No newline at end of file
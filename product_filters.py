@@ -0,0 +1,29 @@
+# Filtros de produto de GET /products, compartilhados pela API (backends.py,
+# indexes.py) e pela pesquisa local do cliente (live_search.py). Sem
+# dependências do servidor: o cliente importa só este módulo.
+
+
+def price_key(product):
+    try:
+        return float(product.get("price") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def product_matcher(name=None, category_id=None, min_price=None, max_price=None):
+    # Predicado com todos os filtros de GET /products
+    name = name.casefold() if name else None
+
+    def matches(product):
+        if category_id is not None and product.get("categoryId") != category_id:
+            return False
+        if min_price is not None or max_price is not None:
+            price = price_key(product)
+            if min_price is not None and price < min_price:
+                return False
+            if max_price is not None and price > max_price:
+                return False
+        if name and name not in str(product.get("name", "")).casefold():
+            return False
+        return True
+    return matches
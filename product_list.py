@@ -0,0 +1,182 @@
+import asyncio
+
+import flet as ft
+
+# Distância (px) do fim da rolagem a partir da qual a próxima página é mostrada
+SCROLL_THRESHOLD = 200
+
+
+def product_subtitle(product, catalog):
+    category_name = catalog.category_names.get(product.get("categoryId"), "Sem categoria")
+    return (
+        f"Preço: R${product['price']:.2f} | "
+        f"Quantidade: {product['quantity']} | "
+        f"Categoria: {category_name}\n"
+        f"Cadastrado em: {catalog.created_label(product)}"
+    )
+
+
+class ProductList:
+    """ListView de produtos com janela: só os primeiros `window` itens ganham tile.
+
+    A janela começa com uma página e cresce uma página por vez quando a rolagem
+    chega perto do fim; com todos os itens já na tela, `on_end` é chamado (a
+    pesquisa busca ali a próxima página do servidor). Os tiles são reaproveitados
+    entre atualizações: só os textos mudam, então o page.update() manda só as
+    propriedades alteradas, não a árvore inteira.
+
+    Os nomes de categoria e as datas formatadas vêm do `catalog`. A lista de
+    cadastro exibe o próprio `catalog.sorted_products`: cada alteração do
+    catálogo é repassada com `patch`, que mexe só nos tiles das posições
+    afetadas, e o page.update() seguinte tem tamanho O(1).
+    """
+
+    def __init__(self, page_size, empty_text, catalog, on_click=None, on_edit=None, on_delete=None,
+                 on_end=None, **list_view_args):
+        self.page_size = page_size
+        self.catalog = catalog
+        self.on_click = on_click
+        self.on_edit = on_edit
+        self.on_delete = on_delete
+        self.on_end = on_end
+        self.items = []
+        self.window = page_size
+        self.lock = catalog.lock
+        self.empty_tile = ft.ListTile(title=ft.Text(empty_text))
+        self.view = ft.ListView(on_scroll=self.scrolled, on_scroll_interval=100, **list_view_args)
+
+    def set_items(self, items, reset_window=False):
+        """Troca os itens exibidos; a janela só volta a uma página com `reset_window`."""
+        with self.lock:
+            self.items = items
+            if reset_window:
+                self.window = self.page_size
+            self.render()
+
+    def refresh(self):
+        # Nomes de categoria mudaram: só os subtítulos da janela são refeitos
+        with self.lock:
+            for tile in self.tiles():
+                self.fill(tile, tile.data)
+
+    def extend(self, items):
+        # Próxima página vinda do servidor: todos os itens novos entram na janela
+        with self.lock:
+            self.items.extend(items)
+            self.window = max(self.window, len(self.items))
+            self.render()
+
+    def clear(self):
+        with self.lock:
+            self.items = []
+            self.window = self.page_size
+            self.view.controls = []
+
+    def patch(self, old_pos, new_pos, product=None):
+        """Atualiza os tiles depois que `items` mudou no lugar.
+
+        `old_pos` é onde o produto estava (None se é novo) e `new_pos` onde
+        está agora (None se saiu), como devolvem Catalog.put_product e
+        Catalog.remove_product.
+        """
+        with self.lock:
+            controls = self.view.controls
+            if controls and controls[0] is self.empty_tile:
+                controls.clear()
+            if old_pos is not None and old_pos == new_pos:
+                if old_pos < len(controls):
+                    self.fill(controls[old_pos], product)
+                return
+            if old_pos is not None and old_pos < len(controls):
+                del controls[old_pos]
+            if new_pos is not None and new_pos < self.window and new_pos <= len(controls):
+                tile = self.new_tile()
+                self.fill(tile, product)
+                controls.insert(new_pos, tile)
+            # A janela não muda de tamanho: sobra tile no fim ou entra o próximo item
+            visible = min(self.window, len(self.items))
+            del controls[visible:]
+            while len(controls) < visible:
+                tile = self.new_tile()
+                self.fill(tile, self.items[len(controls)])
+                controls.append(tile)
+            if not controls:
+                controls.append(self.empty_tile)
+
+    def tiles(self):
+        return [control for control in self.view.controls if control is not self.empty_tile]
+
+    def new_tile(self):
+        tile = ft.ListTile(title=ft.Text(), subtitle=ft.Text())
+        if self.on_click:
+            tile.on_click = self.handler(self.on_click)
+        if self.on_edit or self.on_delete:
+            tile.trailing = ft.Row(
+                controls=[
+                    ft.IconButton(
+                        icon="EDIT",
+                        tooltip="Editar",
+                        on_click=self.handler(self.on_edit),
+                    ),
+                    ft.IconButton(
+                        icon="DELETE",
+                        tooltip="Excluir",
+                        on_click=self.handler(self.on_delete),
+                        icon_color="red"
+                    ),
+                ],
+                width=100,
+            )
+        return tile
+
+    def handler(self, callback):
+        # Handler de evento que repassa o produto do controle; callbacks async
+        # continuam async, para o Flet rodá-los no loop em vez de numa thread
+        if asyncio.iscoroutinefunction(callback):
+            async def handle(e):
+                await callback(e.control.data)
+        else:
+            def handle(e):
+                callback(e.control.data)
+        return handle
+
+    def fill(self, tile, product):
+        tile.data = product
+        tile.title.value = product["name"]
+        tile.subtitle.value = product_subtitle(product, self.catalog)
+        if tile.trailing is not None:
+            for button in tile.trailing.controls:
+                button.data = product
+
+    def render(self):
+        # Preenche a janela reaproveitando os tiles que já estão na tela
+        visible = self.items[:self.window]
+        tiles = self.tiles()
+        del tiles[len(visible):]
+        while len(tiles) < len(visible):
+            tiles.append(self.new_tile())
+        for tile, product in zip(tiles, visible):
+            self.fill(tile, product)
+        controls = tiles if visible else [self.empty_tile]
+        if self.view.controls != controls:
+            self.view.controls = controls
+
+    def has_more(self):
+        return self.window < len(self.items)
+
+    def show_more(self):
+        """Mostra mais uma página dos itens já carregados; False se todos já estão na tela."""
+        with self.lock:
+            if not self.has_more():
+                return False
+            self.window += self.page_size
+            self.render()
+            return True
+
+    def scrolled(self, e):
+        if e.max_scroll_extent is None or e.pixels < e.max_scroll_extent - SCROLL_THRESHOLD:
+            return
+        if self.show_more():
+            self.view.update()
+        elif self.on_end:
+            self.on_end()
@@ -0,0 +1,68 @@
+import numbers
+
+# Validação dos dados recebidos pela API. Só os campos listados aqui são
+# aceitos, para os registros não acumularem chaves avulsas; o "id" pode vir
+# no corpo, mas quem decide o id é o store.
+
+NAME_MAX_LENGTH = 200
+
+PRODUCT_FIELD_RULES = {
+    "name": f"texto não vazio de até {NAME_MAX_LENGTH} caracteres",
+    "price": "número maior ou igual a zero",
+    "quantity": "inteiro maior ou igual a zero",
+    "categoryId": "inteiro",
+    "createdAt": "texto",
+}
+
+CATEGORY_FIELD_RULES = {
+    "name": f"texto não vazio de até {NAME_MAX_LENGTH} caracteres",
+}
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _is_integer(value):
+    return isinstance(value, numbers.Integral) and not isinstance(value, bool)
+
+
+def _field_ok(field, value):
+    if field == "name":
+        return isinstance(value, str) and value.strip() != "" and len(value) <= NAME_MAX_LENGTH
+    if field == "price":
+        return _is_number(value) and value >= 0
+    if field == "quantity":
+        return _is_integer(value) and value >= 0
+    if field == "categoryId":
+        return value is None or _is_integer(value)
+    if field == "createdAt":
+        return isinstance(value, str)
+    return True
+
+
+def _validate(payload, rules, kind, partial):
+    if not isinstance(payload, dict):
+        return [f"{kind} deve ser um objeto JSON"]
+    errors = []
+    if not partial and "name" not in payload:
+        errors.append("name é obrigatório")
+    for field, rule in rules.items():
+        if field in payload and not _field_ok(field, payload[field]):
+            errors.append(f"{field} deve ser {rule}")
+    unknown = [field for field in payload if field not in rules and field != "id"]
+    if unknown:
+        errors.append(f"campos desconhecidos: {', '.join(unknown)}")
+    return errors
+
+
+def validate_product(payload, partial=False):
+    """Lista de erros de um produto; vazia quando está válido.
+
+    Com `partial=True` (alterações) só os campos enviados são verificados.
+    """
+    return _validate(payload, PRODUCT_FIELD_RULES, "o produto", partial)
+
+
+def validate_category(payload):
+    return _validate(payload, CATEGORY_FIELD_RULES, "a categoria", partial=False)
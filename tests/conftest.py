@@ -0,0 +1,59 @@
+import atexit
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Variáveis lidas pela API e pelo storage; cada teste começa sem nenhuma
+STORE_ENV = ("DB_BACKEND", "DB_PATH", "SQLITE_PATH", "STORAGE_MODE", "STORAGE_WRITER", "SNAPSHOT_FORMAT",
+             "DB_SNAPSHOT_PATH", "DB_JOURNAL_PATH", "JOURNAL_FSYNC", "JOURNAL_COMPACT_BYTES")
+
+
+class ApiServer:
+    """api_server importado de novo a cada `start`, como um processo reiniciado.
+
+    O store abre os arquivos do diretório atual (o tmp_path do teste);
+    `restart` fecha o store anterior antes de abrir o próximo.
+    """
+
+    def __init__(self):
+        self.module = None
+
+    def start(self):
+        sys.modules.pop("api_server", None)
+        self.module = importlib.import_module("api_server")
+        return self.module.app.test_client()
+
+    def restart(self):
+        self.stop()
+        return self.start()
+
+    def stop(self):
+        if self.module is not None:
+            self.module.store.close()
+            atexit.unregister(self.module.store.close)
+            self.module = None
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in STORE_ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("DB_BACKEND", request.param)
+    return request.param
+
+
+@pytest.fixture
+def server(backend):
+    server = ApiServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    return server.start()
@@ -0,0 +1,302 @@
+import base64
+import json
+
+import pytest
+
+# Rotas da API contra os dois backends (DB_BACKEND=json e sqlite; ver conftest.py)
+
+NEW_PRODUCTS = [
+    {"name": "Café Especial", "price": 35.5, "quantity": 40, "categoryId": 1},
+    {"name": "Cafeteira Elétrica", "price": 250.0, "quantity": 3, "categoryId": 2},
+    {"name": "Caneca", "price": 20.0, "quantity": 100, "categoryId": 2},
+    {"name": "Pão Integral", "price": 9.9, "quantity": 12, "categoryId": 3},
+    {"name": "Açúcar Orgânico", "price": 12.0, "quantity": 0, "categoryId": 1},
+    {"name": "Garrafa Térmica", "price": 89.9, "quantity": 7, "categoryId": 2},
+]
+
+
+def add_products(client, products=NEW_PRODUCTS):
+    created = []
+    for product in products:
+        response = client.post("/products", json=product)
+        assert response.status_code == 201
+        created.append(response.get_json())
+    return created
+
+
+def all_pages(client, query):
+    # Segue o X-Next-Cursor até a última página
+    items, cursor, pages = [], None, 0
+    while True:
+        url = f"/products?{query}" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        items += response.get_json()
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return items, pages
+
+
+def test_initial_data(client):
+    products = client.get("/products").get_json()
+    categories = client.get("/categories").get_json()
+    assert [p["id"] for p in products] == [1, 2, 3]
+    assert [c["id"] for c in categories] == [1, 2, 3]
+
+
+def test_product_crud(client):
+    response = client.post("/products", json={"name": "Teclado", "price": 150.0, "quantity": 5, "categoryId": 1})
+    assert response.status_code == 201
+    product = response.get_json()
+    assert product["id"] == 4
+    assert product["createdAt"]
+
+    assert client.get("/products/4").get_json() == product
+
+    response = client.put("/products/4", json={"price": 99.9})
+    assert response.status_code == 200
+    assert response.get_json() == dict(product, price=99.9)
+    assert client.get("/products/4").get_json()["price"] == 99.9
+
+    assert client.put("/products/4", json={"price": -1}).status_code == 400
+    assert client.put("/products/4", json={"cor": "azul"}).status_code == 400
+    assert client.post("/products", json={"price": 1.0}).status_code == 400
+    assert client.put("/products/999", json={"price": 1.0}).status_code == 404
+
+    assert client.delete("/products/4").status_code == 200
+    assert client.get("/products/4").status_code == 404
+    assert [p["id"] for p in client.get("/products").get_json()] == [1, 2, 3]
+
+
+def test_category_create(client):
+    response = client.post("/categories", json={"name": "Teclados"})
+    assert response.status_code == 201
+    assert response.get_json() == {"id": 4, "name": "Teclados"}
+    assert client.post("/categories", json={"name": ""}).status_code == 400
+    assert client.get("/categories").get_json()[-1] == {"id": 4, "name": "Teclados"}
+
+
+def test_data_and_ids_survive_restart(server):
+    client = server.start()
+    add_products(client, NEW_PRODUCTS[:2])
+    client.delete("/products/5")
+    client.put("/products/4", json={"quantity": 1})
+    client.post("/categories", json={"name": "Teclados"})
+    before = client.get("/products").get_json()
+
+    client = server.restart()
+    assert client.get("/products").get_json() == before
+    # O id 5 foi excluído antes do restart e não é reaproveitado
+    assert client.post("/products", json={"name": "Mouse", "price": 50.0}).get_json()["id"] == 6
+    assert client.post("/categories", json={"name": "Mouses"}).get_json()["id"] == 5
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("categoryId=2&sort=price&limit=2",
+     lambda p: p.get("categoryId") == 2),
+    ("minPrice=10&maxPrice=300&sort=-price&limit=2",
+     lambda p: 10 <= p["price"] <= 300),
+    ("name=caf&sort=name&limit=1",
+     lambda p: "caf" in p["name"].casefold()),
+    # Maiúsculas fora do ASCII: o LIKE do SQLite não as ignora
+    ("name=CAFÉ&sort=name&limit=1",
+     lambda p: "café" in p["name"].casefold()),
+    ("sort=id&limit=3",
+     lambda p: True),
+])
+def test_filters_with_cursor_pagination(client, query, expected):
+    add_products(client)
+    everything = client.get("/products").get_json()
+    params = dict(part.split("=") for part in query.split("&"))
+    sort = params["sort"].lstrip("-")
+    wanted = sorted((p for p in everything if expected(p)), key=lambda p: (p[sort], p["id"]),
+                    reverse=params["sort"].startswith("-"))
+
+    items, pages = all_pages(client, query)
+    assert [p["id"] for p in items] == [p["id"] for p in wanted]
+    assert pages >= len(wanted) // int(params["limit"])
+
+
+@pytest.mark.parametrize("query", ["sort=price&limit=2", "sort=-price&limit=2", "maxPrice=5000&sort=price&limit=3"])
+def test_pagination_without_price(client, query):
+    # Só o nome é obrigatório: produto sem preço ordena e filtra como preço 0
+    add_products(client, [{"name": f"Sem preço {i}"} for i in range(5)])
+    everything = client.get("/products").get_json()
+    if "maxPrice" in query:
+        everything = [p for p in everything if (p.get("price") or 0) <= 5000]
+    wanted = sorted(everything, key=lambda p: (p.get("price") or 0, p["id"]), reverse=query.startswith("sort=-"))
+
+    items, _ = all_pages(client, query)
+    assert [p["id"] for p in items] == [p["id"] for p in wanted]
+
+
+def test_invalid_query(client):
+    assert client.get("/products?sort=cor").status_code == 400
+    assert client.get("/products?limit=0").status_code == 400
+    assert client.get("/products?sort=id&cursor=xyz").status_code == 400
+    cursor = client.get("/products?sort=price&limit=1").headers["X-Next-Cursor"]
+    assert client.get(f"/products?sort=name&cursor={cursor}").status_code == 400
+
+
+@pytest.mark.parametrize("sort, cursor", [
+    ("id", ["id", "x", 1]),
+    ("name", ["name", 3, 1]),
+    ("price", ["price", "10", 1]),
+    ("price", ["price", 10.0, "1"]),
+    ("id", ["id", True, 1]),
+    ("id", ["id", 1]),
+    ("id", {"sort": "id"}),
+])
+def test_cursor_with_wrong_types(client, sort, cursor):
+    # Cursor montado à mão: recusado com 400 antes de chegar aos índices
+    encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+    assert client.get(f"/products?sort={sort}&limit=2&cursor={encoded}").status_code == 400
+
+
+def test_fields_projection(client):
+    products = client.get("/products?fields=id,name").get_json()
+    assert all(set(p) == {"id", "name"} for p in products)
+    assert set(client.get("/products/1?fields=price").get_json()) == {"price"}
+
+
+def test_search(client):
+    add_products(client)
+    results = client.get("/products/search?q=cafe").get_json()
+    names = [p["name"] for p in results]
+    assert names[:1] == ["Café Especial"]
+    assert set(names) >= {"Café Especial", "Cafeteira Elétrica"}
+    assert [p["name"] for p in client.get("/products/search?q=ACUCAR org").get_json()] == ["Açúcar Orgânico"]
+    assert client.get("/products/search?q=xyzw").get_json() == []
+    assert client.get("/products/search?q=cafe&limit=0").status_code == 400
+
+
+@pytest.mark.parametrize("query, expected", [
+    # Nome começa com a busca, palavra começa com a busca, no meio; do nome mais curto ao mais longo
+    ("caf", ["Cafeteira", "Café Especial", "Cafeteira Elétrica", "Xícara de Café", "Descafeinado"]),
+    # Com menos de 3 caracteres não há busca no meio do nome
+    ("ca", ["Caneca", "Cafeteira", "Café Especial", "Cafeteira Elétrica", "Xícara de Café"]),
+    ("CAFÉ ES", ["Café Especial"]),
+])
+def test_search_order(client, query, expected):
+    add_products(client, NEW_PRODUCTS + [{"name": name} for name in ("Descafeinado", "Xícara de Café", "Cafeteira")])
+    names = [p["name"] for p in client.get(f"/products/search?q={query}").get_json()]
+    assert names == expected
+    limited = [p["name"] for p in client.get(f"/products/search?q={query}&limit=2").get_json()]
+    assert limited == expected[:2]
+
+
+@pytest.mark.parametrize("url", ["/products", "/products?sort=price&limit=2", "/products/1", "/categories",
+                                 "/stats/quantity-by-category"])
+def test_etag_and_not_modified(client, url):
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    repeat = client.get(url, headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.data == b""
+
+    # O PUT muda os produtos e os totais; a categoria nova, /categories e os nomes das estatísticas
+    client.put("/products/1", json={"quantity": 99})
+    client.post("/categories", json={"name": "Teclados"})
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_changes_feed(client):
+    response = client.get("/products")
+    epoch, seq = response.headers["X-Store-Epoch"], int(response.headers["X-Change-Seq"])
+
+    created = add_products(client, NEW_PRODUCTS[:1])[0]
+    client.put(f"/products/{created['id']}", json={"price": 1.0})
+    client.delete("/products/2")
+    client.post("/categories", json={"name": "Teclados"})
+
+    feed = client.get(f"/changes?epoch={epoch}&since={seq}").get_json()
+    assert not feed["reset"]
+    changes = feed["changes"]
+    assert [(c["op"], c["collection"], c["id"]) for c in changes] == [
+        ("put", "products", created["id"]),
+        ("put", "products", created["id"]),
+        ("delete", "products", 2),
+        ("put", "categories", 4),
+    ]
+    assert changes[1]["record"]["price"] == 1.0
+    assert [c["seq"] for c in changes] == list(range(seq + 1, seq + 5))
+    assert feed["version"] == seq + 4
+
+    page = client.get(f"/changes?epoch={epoch}&since={seq}&limit=2").get_json()
+    assert [c["seq"] for c in page["changes"]] == [seq + 1, seq + 2]
+    assert client.get(f"/changes?epoch={epoch}&since={feed['version']}").get_json()["changes"] == []
+    assert client.get(f"/changes?epoch=outro&since={seq}").get_json()["reset"]
+    assert client.get("/changes").status_code == 400
+
+
+def test_bulk_create_is_all_or_nothing(client):
+    items = [{"name": "A", "price": 1.0}, {"name": "", "price": 2.0}, {"name": "C", "price": -3}]
+    response = client.post("/products/bulk", json=items)
+    assert response.status_code == 400
+    assert [item["status"] for item in response.get_json()["items"]] == [424, 400, 400]
+    assert len(client.get("/products").get_json()) == 3
+
+    response = client.post("/products/bulk", json=[{"name": "A", "price": 1.0}, {"name": "B", "price": 2.0}])
+    assert response.status_code == 201
+    assert [item["id"] for item in response.get_json()["items"]] == [4, 5]
+
+    ndjson = '{"name": "C", "price": 3.0}\n{"name": "D", "price": 4.0}\n'
+    response = client.post("/products/bulk", data=ndjson, content_type="application/x-ndjson")
+    assert response.status_code == 201
+    assert [p["name"] for p in client.get("/products").get_json()][-4:] == ["A", "B", "C", "D"]
+
+
+def test_bulk_update_and_delete_are_all_or_nothing(client):
+    before = client.get("/products").get_json()
+
+    response = client.patch("/products/bulk", json=[{"id": 1, "price": 1.0}, {"id": 999, "price": 2.0}])
+    assert response.status_code == 404
+    assert [item["status"] for item in response.get_json()["items"]] == [424, 404]
+    response = client.patch("/products/bulk", json=[{"id": 1, "price": 1.0}, {"id": 2, "price": -2}])
+    assert response.status_code == 400
+    response = client.delete("/products/bulk", json=[1, 999])
+    assert response.status_code == 404
+    assert client.get("/products").get_json() == before
+
+    response = client.patch("/products/bulk", json=[{"id": 1, "price": 1.0}, {"id": 2, "quantity": 0}])
+    assert response.status_code == 200
+    assert client.get("/products/1").get_json()["price"] == 1.0
+    assert client.get("/products/2").get_json()["quantity"] == 0
+
+    response = client.delete("/products/bulk", json=[{"id": 1}, 3])
+    assert response.status_code == 200
+    assert [p["id"] for p in client.get("/products").get_json()] == [2]
+
+
+def test_stats(client):
+    add_products(client)
+    client.delete("/products/1")
+    client.put("/products/2", json={"price": 100.0, "categoryId": 3})
+    products = client.get("/products").get_json()
+    names = {c["id"]: c["name"] for c in client.get("/categories").get_json()}
+
+    quantities, prices = {}, {}
+    for product in products:
+        quantities[product["categoryId"]] = quantities.get(product["categoryId"], 0) + product["quantity"]
+        prices.setdefault(product["categoryId"], []).append(product["price"])
+
+    rows = client.get("/stats/quantity-by-category").get_json()
+    assert {row["categoryId"]: row["quantity"] for row in rows} == quantities
+    assert all(row["name"] == names[row["categoryId"]] for row in rows)
+    assert [row["quantity"] for row in rows] == sorted(quantities.values(), reverse=True)
+
+    rows = client.get("/stats/avg-price-by-category").get_json()
+    assert {row["categoryId"]: row["count"] for row in rows} == {k: len(v) for k, v in prices.items()}
+    for row in rows:
+        assert row["avgPrice"] == pytest.approx(sum(prices[row["categoryId"]]) / len(prices[row["categoryId"]]))
+
+    histogram = client.get("/stats/price-histogram?bins=4").get_json()
+    all_prices = [p["price"] for p in products]
+    assert histogram["edges"][0] == min(all_prices)
+    assert histogram["edges"][-1] == max(all_prices)
+    assert len(histogram["counts"]) == 4
+    assert sum(histogram["counts"]) == len(products)
+    assert client.get("/stats/price-histogram?bins=0").status_code == 400
@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+
+import pytest
+
+from backends import JsonStore
+from storage import (BackgroundPersistence, JournalPersistence, JsonFilePersistence, load_json_streaming,
+                     read_snapshot, write_snapshot)
+
+# Persistência do JsonStore: journal (replay e compactação), snapshots json e
+# binário e a carga do que já está em disco
+
+SEED = {
+    "products": [
+        {"id": 1, "name": "Notebook", "price": 4500.0, "quantity": 10, "categoryId": 1},
+        {"id": 2, "name": "Café Especial ☕", "price": 35.5, "quantity": 40, "categoryId": 2},
+    ],
+    "categories": [{"id": 1, "name": "Notebooks"}, {"id": 2, "name": "Alimentos"}],
+}
+
+
+def journal(tmp_path, **kwargs):
+    kwargs.setdefault("snapshot_path", str(tmp_path / "db.snapshot.json"))
+    return JournalPersistence(journal_path=str(tmp_path / "db.journal"), **kwargs)
+
+
+def state(store):
+    return store.list_products(), store.list_categories(), store.next_ids
+
+
+def make_changes(store):
+    for i in range(20):
+        store.create_product({"name": f"Produto {i}", "price": float(i), "quantity": i, "categoryId": 1})
+    store.update_product(3, {"price": 99.0})
+    store.delete_product(4)
+    store.delete_product(22)
+    store.create_category({"name": "Monitores"})
+
+
+def test_journal_replays_snapshot_and_journal(tmp_path):
+    store = JsonStore(journal(tmp_path), SEED)
+    make_changes(store)
+    expected = state(store)
+    store.close()
+
+    store = JsonStore(journal(tmp_path), {})
+    assert state(store) == expected
+    # O id 22 foi excluído por último e não volta a ser usado
+    assert store.create_product({"name": "Novo", "price": 1.0})["id"] == 23
+    store.close()
+
+
+def test_journal_ignores_truncated_last_line(tmp_path):
+    store = JsonStore(journal(tmp_path), SEED)
+    make_changes(store)
+    expected = state(store)
+    store.close()
+    with open(tmp_path / "db.journal", "a", encoding="utf-8") as f:
+        f.write('{"seq": 999, "op": "put", "col": "produ')
+
+    store = JsonStore(journal(tmp_path), {})
+    assert state(store) == expected
+    store.close()
+
+
+def test_journal_compaction(tmp_path):
+    store = JsonStore(journal(tmp_path, compact_bytes=512), SEED)
+    make_changes(store)
+    expected = state(store)
+    store.close()
+    assert not os.path.exists(tmp_path / "db.journal.1")
+    data, seq = read_snapshot(str(tmp_path / "db.snapshot.json"))
+    assert seq > 0
+
+    store = JsonStore(journal(tmp_path), {})
+    assert state(store) == expected
+    store.close()
+
+
+def test_journal_resumes_interrupted_compaction(tmp_path):
+    persistence = journal(tmp_path)
+    store = JsonStore(persistence, SEED)
+    make_changes(store)
+    # Rotação feita, compactação não: o journal rotacionado fica em disco
+    persistence._rotate()
+    store.create_product({"name": "Depois da rotação", "price": 1.0})
+    expected = state(store)
+    store.close()
+    assert os.path.exists(tmp_path / "db.journal.1")
+
+    store = JsonStore(journal(tmp_path), {})
+    assert state(store) == expected
+    store.close()
+    assert not os.path.exists(tmp_path / "db.journal.1")
+
+
+@pytest.mark.parametrize("fmt", ["json", "binary"])
+def test_snapshot_roundtrip(tmp_path, fmt):
+    path = str(tmp_path / "snapshot")
+    data = dict(SEED, meta={"nextIds": {"products": 10, "categories": 3}})
+    write_snapshot(path, data, 42, fmt)
+    loaded, seq = read_snapshot(path)
+    assert seq == 42
+    assert loaded == data
+
+
+@pytest.mark.parametrize("fmt", ["json", "binary"])
+def test_journal_loads_existing_snapshot(tmp_path, fmt):
+    store = JsonStore(journal(tmp_path, snapshot_format=fmt, snapshot_path=None), SEED)
+    make_changes(store)
+    store.persistence.compact()
+    expected = state(store)
+    store.close()
+
+    # Os dados iniciais só valem na primeira execução
+    store = JsonStore(journal(tmp_path, snapshot_format=fmt, snapshot_path=None),
+                      {"products": [], "categories": []})
+    assert state(store) == expected
+    store.close()
+
+
+def test_snapshot_default_path_follows_format(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = JsonStore(JournalPersistence(snapshot_format="json"), SEED)
+    make_changes(store)
+    expected = state(store)
+    store.close()
+    assert os.path.exists("db.snapshot.json")
+
+    # Trocar o formato converte o snapshot antigo, que o journal continua
+    store = JsonStore(JournalPersistence(snapshot_format="binary"), {})
+    assert state(store) == expected
+    store.close()
+    assert not os.path.exists("db.snapshot.json")
+    with open("db.snapshot", "rb") as f:
+        assert f.read(8) == b"PAPISNP1"
+
+
+def test_json_file_loads_existing_data(tmp_path):
+    path = str(tmp_path / "db.json")
+    store = JsonStore(JsonFilePersistence(path), SEED)
+    make_changes(store)
+    expected = state(store)
+
+    with open(path, encoding="utf-8") as f:
+        assert load_json_streaming(path) == json.load(f)
+    store = JsonStore(JsonFilePersistence(path), {"products": [], "categories": []})
+    assert state(store) == expected
+
+
+def test_load_json_streaming_small_chunks(tmp_path):
+    path = tmp_path / "db.json"
+    document = {"products": SEED["products"] * 50, "categories": SEED["categories"],
+                "meta": {"nextIds": {"products": 3}}, "texto": 'aspas " e \\ barra'}
+    path.write_text(json.dumps(document, ensure_ascii=False), encoding="utf-8")
+    assert load_json_streaming(str(path), chunk_size=7) == document
+
+
+def test_background_writer_flushes_on_close(tmp_path):
+    path = str(tmp_path / "db.json")
+    store = JsonStore(BackgroundPersistence(JsonFilePersistence(path)), SEED)
+    make_changes(store)
+    expected = state(store)
+    store.close()
+
+    store = JsonStore(JsonFilePersistence(path), {})
+    assert state(store) == expected
+
+
+def test_json_file_concurrent_writes(tmp_path):
+    # A reescrita fica fora do lock do store: o arquivo final tem o snapshot mais novo
+    path = str(tmp_path / "db.json")
+    store = JsonStore(JsonFilePersistence(path), SEED)
+
+    def write(k):
+        for i in range(25):
+            product = store.create_product({"name": f"Produto {k}-{i}", "price": float(i)})
+            store.update_product(product["id"], {"quantity": i})
+
+    threads = [threading.Thread(target=write, args=(k,)) for k in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    expected = state(store)
+    assert len(expected[0]) == 102
+
+    store = JsonStore(JsonFilePersistence(path), {})
+    assert state(store) == expected